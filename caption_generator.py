@@ -1,12 +1,14 @@
-import os
+import asyncio
+import hashlib
 import random
 import logging
 from typing import List, Optional
-from functools import lru_cache
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
+from cachetools import TTLCache
+import httpx
+import openai
+from openai import AsyncOpenAI
+import config
+from retry import RETRYABLE_STATUS_CODES, MAX_ATTEMPTS, backoff_delay, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +16,36 @@ class CaptionGenerator:
     # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
     # do not change this unless explicitly requested by the user
     
-    FALLBACK_HOOKS = [
+    # Per-request timeout for streamed completions; a stalled request is
+    # restarted instead of waiting out the SDK's 600s default
+    REQUEST_TIMEOUT = 10.0
+    
+    SYSTEM_MESSAGE = {
+        "role": "system",
+        "content": "You are a viral Instagram content creator expert who specializes in writing engaging, high-converting captions that drive engagement and followers."
+    }
+    
+    # Static parts of the caption prompt; only the video context is interpolated per call
+    PROMPT_PREFIX = "Generate a catchy, viral Instagram caption for a video."
+    PROMPT_SUFFIX = """
+
+Requirements:
+- Start with an attention-grabbing hook (use emojis)
+- Make it engaging and compelling
+- Keep it concise (under 150 characters for the main text)
+- Add 15-20 relevant trending hashtags
+- End with a call-to-action like "Follow for more!" or "Double tap if you agree!"
+- Make it sound natural and authentic, not robotic
+- Focus on creating FOMO (fear of missing out)
+
+Format the caption exactly like this:
+[Attention-grabbing hook with emoji]
+
+[15-20 hashtags separated by spaces]
+
+[Call to action]"""
+    
+    FALLBACK_HOOKS = (
         "🚀 This will change everything!",
         "🤯 Mind-blowing content you need to see!",
         "💡 This is incredible!",
@@ -25,40 +56,64 @@ class CaptionGenerator:
         "💥 Groundbreaking content revealed!",
         "🚨 Alert: This changes the game completely!",
         "✨ The most impressive thing you'll see today!",
-    ]
+    )
     
-    HASHTAGS = [
+    HASHTAGS = (
         "#Viral", "#Trending", "#Amazing", "#Incredible", "#MustWatch",
         "#Explore", "#ForYou", "#Wow", "#Insane", "#Epic",
         "#ContentCreator", "#Insta", "#InstaGood", "#InstaDaily", "#InstaMood",
         "#PhotoOfTheDay", "#Video", "#Reel", "#Reels", "#Vibes",
         "#Motivation", "#Inspiration", "#Goals", "#Success", "#Lifestyle",
         "#Follow", "#Like", "#Share", "#Comment", "#Engagement"
-    ]
+    )
+    
+    # One connection pool to the OpenAI API shared by every generator instance
+    _http_client: Optional[httpx.AsyncClient] = None
+    
+    @classmethod
+    def _get_http_client(cls) -> httpx.AsyncClient:
+        if cls._http_client is None or cls._http_client.is_closed:
+            cls._http_client = openai.DefaultAsyncHttpxClient()
+        return cls._http_client
     
     def __init__(self):
         logger.info("Initializing AI-powered Caption Generator")
-        self.use_ai = os.getenv('USE_AI_CAPTIONS', 'true').lower() == 'true'
+        self.use_ai = config.USE_AI_CAPTIONS
+        # Reposts of the same trending video reuse its caption for a day
+        self._caption_cache = TTLCache(maxsize=256, ttl=86400)
+        # Caps in-flight completions when several captions are generated concurrently
+        self._semaphore = asyncio.Semaphore(config.OPENAI_CONCURRENCY)
+        
+        # Hashtags joined once; _hashtag_offsets[i] is where tag i starts in the joined text
+        self._hashtag_text = " ".join(self.HASHTAGS)
+        self._hashtag_offsets = [0]
+        for tag in self.HASHTAGS:
+            self._hashtag_offsets.append(self._hashtag_offsets[-1] + len(tag) + 1)
         
         if self.use_ai:
             try:
-                api_key = os.getenv('OPENAI_API_KEY')
+                api_key = config.OPENAI_API_KEY
                 if not api_key:
                     logger.warning("OPENAI_API_KEY not set, falling back to template captions")
                     self.use_ai = False
                     self.openai_client = None
                 else:
-                    self.openai_client = OpenAI(api_key=api_key)
+                    self.openai_client = AsyncOpenAI(
+                        api_key=api_key,
+                        timeout=self.REQUEST_TIMEOUT,
+                        max_retries=0,
+                        http_client=self._get_http_client()
+                    )
                     logger.info("OpenAI client initialized with gpt-5 model")
             except Exception as e:
-                logger.error(f"Failed to initialize OpenAI client: {e}")
+                logger.error("Failed to initialize OpenAI client: %s", e)
                 self.use_ai = False
                 self.openai_client = None
         else:
             logger.info("AI captions disabled, using template-based generation")
             self.openai_client = None
     
-    def generate_ai_caption(self, video_context: Optional[str] = None) -> Optional[str]:
+    async def generate_ai_caption(self, video_context: Optional[str] = None) -> Optional[str]:
         """
         Generate AI-powered caption using OpenAI gpt-5
         
@@ -72,66 +127,68 @@ class CaptionGenerator:
             if not self.openai_client:
                 return None
             
+            cache_key = hashlib.blake2s(video_context.encode()).digest() if video_context else None
+            if cache_key is not None and cache_key in self._caption_cache:
+                logger.info("Using cached AI caption for this video context")
+                return self._caption_cache[cache_key]
+            
             logger.info("Generating AI caption with OpenAI gpt-5")
             
             context_text = f" The video is about: {video_context}" if video_context else ""
             
-            prompt = f"""Generate a catchy, viral Instagram caption for a video.{context_text}
-
-Requirements:
-- Start with an attention-grabbing hook (use emojis)
-- Make it engaging and compelling
-- Keep it concise (under 150 characters for the main text)
-- Add 15-20 relevant trending hashtags
-- End with a call-to-action like "Follow for more!" or "Double tap if you agree!"
-- Make it sound natural and authentic, not robotic
-- Focus on creating FOMO (fear of missing out)
-
-Format the caption exactly like this:
-[Attention-grabbing hook with emoji]
-
-[15-20 hashtags separated by spaces]
-
-[Call to action]"""
-
-            response = self.openai_client.chat.completions.create(
-                model="gpt-5",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a viral Instagram content creator expert who specializes in writing engaging, high-converting captions that drive engagement and followers."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_completion_tokens=500
-            )
+            prompt = self.PROMPT_PREFIX + context_text + self.PROMPT_SUFFIX
+            messages = [self.SYSTEM_MESSAGE, {"role": "user", "content": prompt}]
             
-            caption = response.choices[0].message.content.strip()
-            logger.info(f"AI caption generated successfully (length: {len(caption)} chars)")
+            caption = None
+            
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                try:
+                    parts = []
+                    async with self._semaphore:
+                        async with await self.openai_client.chat.completions.create(
+                            model="gpt-5",
+                            messages=messages,
+                            max_completion_tokens=500,
+                            stream=True
+                        ) as stream:
+                            async for chunk in stream:
+                                if chunk.choices and chunk.choices[0].delta.content:
+                                    parts.append(chunk.choices[0].delta.content)
+                    caption = "".join(parts).strip()
+                    break
+                except (openai.APITimeoutError, httpx.TimeoutException):
+                    logger.warning("AI caption request timed out after %ss (attempt %s/%s)", self.REQUEST_TIMEOUT, attempt, MAX_ATTEMPTS)
+                except openai.APIStatusError as e:
+                    if e.status_code not in RETRYABLE_STATUS_CODES or attempt == MAX_ATTEMPTS:
+                        raise
+                    delay = backoff_delay(attempt, parse_retry_after(e.response.headers))
+                    logger.warning("OpenAI returned %s (attempt %s/%s), retrying in %.1fs", e.status_code, attempt, MAX_ATTEMPTS, delay)
+                    await asyncio.sleep(delay)
+            
+            if not caption:
+                logger.error("No AI caption received from OpenAI")
+                return None
+            
+            if cache_key is not None:
+                self._caption_cache[cache_key] = caption
+            
+            logger.info("AI caption generated successfully (length: %s chars)", len(caption))
             return caption
             
         except Exception as e:
-            logger.error(f"Error generating AI caption: {e}", exc_info=True)
+            logger.error("Error generating AI caption: %s", e, exc_info=True)
             return None
     
-    @lru_cache(maxsize=128)
-    def _get_cached_hashtags(self, count: int, seed: int) -> tuple:
-        """Cache hashtag selections for faster generation"""
-        rng = random.Random(seed)
-        hashtags = tuple(rng.sample(self.HASHTAGS, k=min(count, len(self.HASHTAGS))))
-        return hashtags
+    def _sample_hashtags(self) -> str:
+        """Pick a run of 15-20 consecutive hashtags for a template caption"""
+        count = random.randint(15, 20)
+        start = random.randint(0, len(self.HASHTAGS) - count)
+        return self._hashtag_text[self._hashtag_offsets[start]:self._hashtag_offsets[start + count] - 1]
     
     def generate_template_caption(self) -> str:
         """Generate template-based caption (fallback method)"""
         hook = random.choice(self.FALLBACK_HOOKS)
-        
-        seed = random.randint(0, 1000000)
-        hashtag_count = random.randint(15, 20)
-        hashtags = self._get_cached_hashtags(hashtag_count, seed)
-        hashtag_text = " ".join(hashtags)
+        hashtag_text = self._sample_hashtags()
         
         caption = f"""{hook}
 
@@ -141,7 +198,7 @@ Follow for more! 💯"""
         
         return caption
     
-    def generate_caption(self, video_context: Optional[str] = None) -> str:
+    async def generate_caption(self, video_context: Optional[str] = None) -> str:
         """
         Generate caption - tries AI first, falls back to templates
         
@@ -152,7 +209,7 @@ Follow for more! 💯"""
             Generated caption
         """
         if self.use_ai:
-            ai_caption = self.generate_ai_caption(video_context)
+            ai_caption = await self.generate_ai_caption(video_context)
             if ai_caption:
                 return ai_caption
             else:
@@ -160,7 +217,21 @@ Follow for more! 💯"""
         
         return self.generate_template_caption()
     
-    def generate_custom_caption(self, custom_hook: Optional[str] = None, 
+    async def generate_captions(self, video_contexts: List[Optional[str]]) -> List[str]:
+        """
+        Generate captions for several videos concurrently
+        
+        Args:
+            video_contexts: Optional context for each video
+            
+        Returns:
+            Generated captions, in the same order as video_contexts
+        """
+        return list(await asyncio.gather(
+            *(self.generate_caption(video_context) for video_context in video_contexts)
+        ))
+    
+    async def generate_custom_caption(self, custom_hook: Optional[str] = None, 
                                custom_hashtags: Optional[List[str]] = None,
                                video_context: Optional[str] = None) -> str:
         """
@@ -176,7 +247,7 @@ Follow for more! 💯"""
         """
         # If using AI and video context provided, use AI generation
         if self.use_ai and video_context:
-            ai_caption = self.generate_ai_caption(video_context)
+            ai_caption = await self.generate_ai_caption(video_context)
             if ai_caption:
                 return ai_caption
         
@@ -186,10 +257,7 @@ Follow for more! 💯"""
         if custom_hashtags:
             hashtag_text = " ".join(custom_hashtags)
         else:
-            seed = random.randint(0, 1000000)
-            hashtag_count = random.randint(15, 20)
-            hashtags = self._get_cached_hashtags(hashtag_count, seed)
-            hashtag_text = " ".join(hashtags)
+            hashtag_text = self._sample_hashtags()
         
         caption = f"""{hook}
 
@@ -199,6 +267,10 @@ Follow for more! 💯"""
         
         return caption
     
-    def clear_cache(self):
-        """Clear LRU cache if needed"""
-        self._get_cached_hashtags.cache_clear()
+    async def close(self):
+        """Close the shared OpenAI HTTP connection pool"""
+        if self.openai_client:
+            await self.openai_client.close()
+        if CaptionGenerator._http_client is not None and CaptionGenerator._http_client.is_closed:
+            CaptionGenerator._http_client = None
+        logger.info("Caption Generator HTTP client closed")
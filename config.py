@@ -0,0 +1,55 @@
+import os
+from dotenv import load_dotenv
+
+# Parse .env once for the whole process; every module reads settings from here
+load_dotenv()
+
+# ===== INSTAGRAM GRAPH API CONFIGURATION =====
+INSTAGRAM_ACCESS_TOKEN = os.getenv('INSTAGRAM_ACCESS_TOKEN')
+INSTAGRAM_USER_ID = os.getenv('INSTAGRAM_USER_ID')
+GRAPH_API_VERSION = os.getenv('GRAPH_API_VERSION', 'v21.0')
+
+# ===== INSTAGRAM SCRAPER CREDENTIALS =====
+INSTAGRAM_SCRAPER_USERNAME = os.getenv('INSTAGRAM_SCRAPER_USERNAME', '')
+INSTAGRAM_SCRAPER_PASSWORD = os.getenv('INSTAGRAM_SCRAPER_PASSWORD', '')
+INSTAGRAM_SESSION_FILE = os.getenv('INSTAGRAM_SESSION_FILE', 'instagram_session.json')
+
+# ===== OPENAI API CONFIGURATION =====
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+USE_AI_CAPTIONS = os.getenv('USE_AI_CAPTIONS', 'true').lower() == 'true'
+OPENAI_CONCURRENCY = int(os.getenv('OPENAI_CONCURRENCY', '5'))
+
+# ===== TELEGRAM BOT CONFIGURATION =====
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
+TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', '')
+
+# ===== AUTO-REPOST SCHEDULING =====
+POSTING_INTERVAL_HOURS = int(os.getenv('POSTING_INTERVAL_HOURS', '3'))
+POSTING_INTERVAL = POSTING_INTERVAL_HOURS * 3600
+
+# ===== VIRAL VIDEO FILTERS =====
+MIN_LIKES = int(os.getenv('MIN_LIKES', '10000'))
+MIN_VIEWS = int(os.getenv('MIN_VIEWS', '50000'))
+MIN_ENGAGEMENT_RATE = float(os.getenv('MIN_ENGAGEMENT_RATE', '0.05'))
+EXPLORE_FETCH_COUNT = int(os.getenv('EXPLORE_FETCH_COUNT', '50'))
+EXPLORE_CACHE_TTL = int(os.getenv('EXPLORE_CACHE_TTL', '900'))
+
+# ===== VIDEO DOWNLOAD CONFIGURATION =====
+VIDEO_DOWNLOAD_PATH = os.getenv('VIDEO_DOWNLOAD_PATH', 'downloaded_videos')
+DOWNLOAD_CONNECTIONS = int(os.getenv('DOWNLOAD_CONNECTIONS', '6'))
+DOWNLOAD_FSYNC = os.getenv('DOWNLOAD_FSYNC', 'false').lower() == 'true'
+
+# ===== VIDEO HOSTING =====
+VIDEO_URL = os.getenv('VIDEO_URL')
+
+# ===== CREDIT MONITORING =====
+CREDIT_LIMIT = float(os.getenv('CREDIT_LIMIT', '3.0'))
+CREDIT_CHECK_INTERVAL = int(os.getenv('CREDIT_CHECK_INTERVAL', '3600'))
+TRIGGER_ZIP_CREATION = os.getenv('TRIGGER_ZIP_CREATION', 'false').lower() == 'true'
+
+# ===== SERVER CONFIGURATION =====
+PORT = int(os.getenv('PORT', '5000'))
+REPLIT_DOMAIN = os.getenv('REPLIT_DOMAINS', 'your-repl.replit.dev').split(',')[0]
+
+# ===== SECURITY =====
+TRIGGER_API_KEY = os.getenv('TRIGGER_API_KEY', '')
@@ -3,33 +3,47 @@ import asyncio
 import logging
 import zipfile
 from pathlib import Path
-from typing import Optional
-from telegram_notifier import TelegramNotifier
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import Iterator, Optional
+from telegram_notifier import TelegramNotifier, get_notifier
+import download_tokens
+import config
 
 logger = logging.getLogger(__name__)
 
 class CreditMonitor:
-    def __init__(self):
+    EXCLUDED_DIRS = {'.pythonlibs', '__pycache__', '.git', 'node_modules', '.venv'}
+    EXCLUDED_FILES = {
+        'instagram_bot_package.zip',
+        '.env',
+        '.env.local',
+        '.env.production'
+    }
+    
+    def __init__(self, telegram: Optional[TelegramNotifier] = None):
+        """
+        Initialize the credit monitor
+        
+        Args:
+            telegram: Existing notifier to reuse (defaults to the shared notifier)
+        """
         logger.info("Initializing Credit Monitor")
-        self.credit_limit = float(os.getenv('CREDIT_LIMIT', '3.0'))
-        self.check_interval = int(os.getenv('CREDIT_CHECK_INTERVAL', '3600'))
+        self.credit_limit = config.CREDIT_LIMIT
+        self.check_interval = config.CREDIT_CHECK_INTERVAL
         
         try:
-            self.telegram = TelegramNotifier()
+            self.telegram = telegram or get_notifier()
             logger.info("Telegram notifier initialized in credit monitor")
         except Exception as e:
-            logger.error(f"Failed to initialize Telegram in credit monitor: {e}")
+            logger.error("Failed to initialize Telegram in credit monitor: %s", e)
             self.telegram = None
         
         self.zip_created = False
-        logger.info(f"Credit Monitor initialized with limit: ${self.credit_limit}, check interval: {self.check_interval}s")
+        self.monitor_task = None
+        logger.info("Credit Monitor initialized with limit: $%s, check interval: %ss", self.credit_limit, self.check_interval)
     
     async def get_replit_credit_usage(self) -> float:
         try:
-            manual_trigger = os.getenv('TRIGGER_ZIP_CREATION', 'false').lower() == 'true'
+            manual_trigger = config.TRIGGER_ZIP_CREATION
             if manual_trigger:
                 logger.info("Manual ZIP creation trigger detected in environment")
                 return self.credit_limit
@@ -37,9 +51,18 @@ class CreditMonitor:
             logger.debug("No manual trigger, returning 0.0 usage")
             return 0.0
         except Exception as e:
-            logger.error(f"Error getting credit usage: {e}", exc_info=True)
+            logger.error("Error getting credit usage: %s", e, exc_info=True)
             return 0.0
     
+    def _iter_project_files(self, directory: str) -> Iterator[str]:
+        """Recursively yield project file paths, skipping excluded directories and files"""
+        for root, dirs, files in os.walk(directory):
+            # Pruning in place stops os.walk from descending into excluded directories
+            dirs[:] = [d for d in dirs if d not in self.EXCLUDED_DIRS]
+            for file in files:
+                if file not in self.EXCLUDED_FILES:
+                    yield os.path.join(root, file)
+    
     def create_project_zip(self) -> Optional[str]:
         try:
             logger.info("Starting project ZIP creation")
@@ -50,48 +73,27 @@ class CreditMonitor:
                 logger.info("Removing existing ZIP file")
                 zip_path.unlink()
             
-            with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                excluded_dirs = {'.pythonlibs', '__pycache__', '.git', 'node_modules', '.venv'}
-                excluded_files = {
-                    'instagram_bot_package.zip',
-                    '.env',
-                    '.env.local',
-                    '.env.production',
-                    'download_token.txt'
-                }
-                
+            # Level 1 compresses several times faster than the default 6 for a slightly larger archive
+            with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
                 files_added = 0
-                for root, dirs, files in os.walk('.'):
-                    dirs[:] = [d for d in dirs if d not in excluded_dirs]
-                    
-                    for file in files:
-                        if file not in excluded_files:
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.relpath(file_path, '.')
-                            zipf.write(file_path, arcname)
-                            logger.debug(f"Added to ZIP: {arcname}")
-                            files_added += 1
+                for file_path in self._iter_project_files('.'):
+                    arcname = os.path.relpath(file_path, '.')
+                    zipf.write(file_path, arcname)
+                    logger.debug("Added to ZIP: %s", arcname)
+                    files_added += 1
             
-            logger.info(f"Project ZIP created successfully: {zip_filename} ({files_added} files)")
-            logger.info(f"SECURITY: .env and sensitive files excluded from ZIP")
+            logger.info("Project ZIP created successfully: %s (%s files)", zip_filename, files_added)
+            logger.info("SECURITY: .env and sensitive files excluded from ZIP")
             return zip_filename
             
         except Exception as e:
-            logger.error(f"Error creating ZIP: {e}", exc_info=True)
+            logger.error("Error creating ZIP: %s", e, exc_info=True)
             return None
     
     def generate_download_token(self) -> str:
-        try:
-            import secrets
-            token = secrets.token_urlsafe(32)
-            token_file = 'download_token.txt'
-            with open(token_file, 'w') as f:
-                f.write(token)
-            logger.info("Generated download token for automatic trigger")
-            return token
-        except Exception as e:
-            logger.error(f"Error generating download token: {e}", exc_info=True)
-            raise
+        token = download_tokens.generate_download_token()
+        logger.info("Generated download token for automatic trigger")
+        return token
     
     async def handle_credit_limit_reached(self, download_token: Optional[str] = None):
         try:
@@ -107,10 +109,11 @@ class CreditMonitor:
                     "warning"
                 )
             
-            zip_file = self.create_project_zip()
+            # Compression is CPU-bound; keep the event loop free while it runs
+            zip_file = await asyncio.to_thread(self.create_project_zip)
             
             if zip_file:
-                replit_domain = os.getenv('REPLIT_DOMAINS', 'your-repl.replit.dev').split(',')[0]
+                replit_domain = config.REPLIT_DOMAIN
                 
                 if not download_token:
                     download_token = self.generate_download_token()
@@ -122,7 +125,7 @@ class CreditMonitor:
                     await self.telegram.send_zip_download_link(download_url)
                 
                 self.zip_created = True
-                logger.info(f"ZIP package ready for download at: {download_url}")
+                logger.info("ZIP package ready for download at: %s", download_url)
             else:
                 logger.error("Failed to create project package")
                 if self.telegram:
@@ -132,29 +135,31 @@ class CreditMonitor:
                     )
         
         except Exception as e:
-            logger.error(f"Error handling credit limit: {e}", exc_info=True)
+            logger.error("Error handling credit limit: %s", e, exc_info=True)
     
     async def monitor_credits(self):
         logger.info("Starting credit monitoring loop")
         while True:
             try:
                 current_usage = await self.get_replit_credit_usage()
-                logger.debug(f"Current credit usage: ${current_usage:.2f}")
+                logger.debug("Current credit usage: $%.2f", current_usage)
                 
                 if current_usage >= self.credit_limit:
-                    logger.warning(f"Credit limit reached: ${current_usage:.2f} >= ${self.credit_limit}")
+                    logger.warning("Credit limit reached: $%.2f >= $%s", current_usage, self.credit_limit)
                     await self.handle_credit_limit_reached()
                 
                 await asyncio.sleep(self.check_interval)
                 
             except Exception as e:
-                logger.error(f"Error in credit monitoring loop: {e}", exc_info=True)
+                logger.error("Error in credit monitoring loop: %s", e, exc_info=True)
                 await asyncio.sleep(self.check_interval)
     
-    async def start_monitoring(self):
+    async def start_monitoring(self, task_group: Optional[asyncio.TaskGroup] = None) -> asyncio.Task:
         try:
-            asyncio.create_task(self.monitor_credits())
-            logger.info(f"Credit monitoring started (limit: ${self.credit_limit}, interval: {self.check_interval}s)")
+            create_task = task_group.create_task if task_group else asyncio.create_task
+            self.monitor_task = create_task(self.monitor_credits())
+            logger.info("Credit monitoring started (limit: $%s, interval: %ss)", self.credit_limit, self.check_interval)
+            return self.monitor_task
         except Exception as e:
-            logger.error(f"Failed to start credit monitoring: {e}", exc_info=True)
+            logger.error("Failed to start credit monitoring: %s", e, exc_info=True)
             raise
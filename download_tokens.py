@@ -0,0 +1,35 @@
+import secrets
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# One-time download tokens live in memory; the bot and the HTTP endpoints share this process
+_lock = threading.Lock()
+_current_token: Optional[str] = None
+
+def generate_download_token() -> str:
+    global _current_token
+    token = secrets.token_urlsafe(32)
+    with _lock:
+        _current_token = token
+    logger.info("Generated new download token")
+    return token
+
+def validate_download_token(provided_token: str) -> bool:
+    try:
+        with _lock:
+            stored_token = _current_token
+        # Constant-time comparison so the token cannot be guessed by timing responses
+        is_valid = bool(stored_token) and secrets.compare_digest(provided_token.encode(), stored_token.encode())
+        logger.info("Download token validation: %s", is_valid)
+        return is_valid
+    except Exception as e:
+        logger.error("Error validating download token: %s", e)
+        return False
+
+def invalidate_download_token():
+    global _current_token
+    with _lock:
+        _current_token = None
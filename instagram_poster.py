@@ -1,62 +1,112 @@
-import os
 import asyncio
 import logging
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+from urllib.parse import urlencode
+from typing import Optional, Dict, Any, List, Tuple
+import config
 import httpx
-
-load_dotenv()
+import orjson
+from retry import RETRYABLE_STATUS_CODES, MAX_ATTEMPTS, backoff_delay, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
 class InstagramPoster:
+    # Container status polling backs off from 1s up to 15s between checks
+    POLL_INITIAL_DELAY = 1.0
+    POLL_MAX_DELAY = 15.0
+    # Maximum concurrent Graph API requests when posting a batch
+    MAX_CONCURRENT_REQUESTS = 5
+    FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+    
+    # One connection pool shared by every poster instance
+    _client: Optional[httpx.AsyncClient] = None
+    
+    @classmethod
+    def _get_client(cls) -> httpx.AsyncClient:
+        if cls._client is None or cls._client.is_closed:
+            # Create persistent HTTP client with connection pooling for speed
+            cls._client = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+                http2=True  # Enable HTTP/2 for faster requests
+            )
+        return cls._client
+    
     def __init__(self):
         logger.info("Initializing Instagram Poster with HTTP connection pooling")
-        self.access_token = os.getenv('INSTAGRAM_ACCESS_TOKEN')
-        self.ig_user_id = os.getenv('INSTAGRAM_USER_ID')
-        self.graph_api_version = os.getenv('GRAPH_API_VERSION', 'v21.0')
+        self.access_token = config.INSTAGRAM_ACCESS_TOKEN
+        self.ig_user_id = config.INSTAGRAM_USER_ID
+        self.graph_api_version = config.GRAPH_API_VERSION
         self.base_url = f"https://graph.facebook.com/{self.graph_api_version}"
         
         if not self.access_token or not self.ig_user_id:
             logger.error("INSTAGRAM_ACCESS_TOKEN and INSTAGRAM_USER_ID must be set in .env file")
             raise ValueError("Instagram credentials not configured")
         
-        # Create persistent HTTP client with connection pooling for speed
-        self.client = httpx.AsyncClient(
-            timeout=30.0,
-            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
-            http2=True  # Enable HTTP/2 for faster requests
-        )
+        self.client = self._get_client()
         
-        logger.info(f"Instagram Poster initialized with HTTP/2 and connection pooling")
+        # Static form fields are encoded once; each request only encodes its own values
+        self._container_body_prefix = urlencode({
+            'access_token': self.access_token,
+            'media_type': 'REELS',
+            'share_to_feed': 'true'
+        }).encode()
+        self._publish_body_prefix = urlencode({'access_token': self.access_token}).encode()
+        
+        logger.info("Instagram Poster initialized with HTTP/2 and connection pooling")
+    
+    @staticmethod
+    def _is_retryable(error: httpx.HTTPError) -> bool:
+        """Timeouts and transient status codes are worth another attempt"""
+        if isinstance(error, httpx.TimeoutException):
+            return True
+        return isinstance(error, httpx.HTTPStatusError) and error.response.status_code in RETRYABLE_STATUS_CODES
+    
+    async def _request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        """
+        Send a Graph API request, retrying timeouts and transient errors with backoff
+        
+        Only idempotent calls go through here; publishing is retried by publish_container
+        after it has checked whether the first attempt went through
+        """
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                response = await self.client.request(method, endpoint, **kwargs)
+                response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                if not self._is_retryable(e) or attempt == MAX_ATTEMPTS:
+                    raise
+                if isinstance(e, httpx.HTTPStatusError):
+                    delay = backoff_delay(attempt, parse_retry_after(e.response.headers))
+                    logger.warning("HTTP %s on %s %s (attempt %s/%s), retrying in %.1fs", e.response.status_code, method, endpoint, attempt, MAX_ATTEMPTS, delay)
+                else:
+                    delay = backoff_delay(attempt)
+                    logger.warning("Timeout on %s %s (attempt %s/%s), retrying in %.1fs", method, endpoint, attempt, MAX_ATTEMPTS, delay)
+            await asyncio.sleep(delay)
         
     async def create_video_container(self, video_url: str, caption: str) -> Optional[str]:
         try:
-            logger.info(f"Creating video container for URL: {video_url[:50]}...")
+            logger.info("Creating video container for URL: %s...", video_url[:50])
             endpoint = f"{self.base_url}/{self.ig_user_id}/media"
-            params = {
-                'access_token': self.access_token,
+            body = self._container_body_prefix + b'&' + urlencode({
                 'video_url': video_url,
-                'media_type': 'REELS',
-                'caption': caption,
-                'share_to_feed': 'true'
-            }
+                'caption': caption
+            }).encode()
             
-            response = await self.client.post(endpoint, params=params)
-            response.raise_for_status()
+            response = await self._request('POST', endpoint, content=body, headers=self.FORM_HEADERS)
             
-            container_id = response.json().get('id')
-            logger.info(f"Video container created successfully: {container_id}")
+            container_id = orjson.loads(response.content).get('id')
+            logger.info("Video container created successfully: %s", container_id)
             return container_id
             
         except httpx.TimeoutException:
             logger.error("Timeout while creating video container")
             return None
         except httpx.HTTPError as e:
-            logger.error(f"HTTP error creating video container: {e}")
+            logger.error("HTTP error creating video container: %s", e)
             return None
         except Exception as e:
-            logger.error(f"Unexpected error creating video container: {e}", exc_info=True)
+            logger.error("Unexpected error creating video container: %s", e, exc_info=True)
             return None
     
     async def check_container_status(self, container_id: str) -> str:
@@ -67,47 +117,79 @@ class InstagramPoster:
                 'access_token': self.access_token
             }
             
-            response = await self.client.get(endpoint, params=params)
-            response.raise_for_status()
+            response = await self._request('GET', endpoint, params=params)
             
-            status = response.json().get('status_code', 'UNKNOWN')
-            logger.debug(f"Container {container_id} status: {status}")
+            status = orjson.loads(response.content).get('status_code', 'UNKNOWN')
+            logger.debug("Container %s status: %s", container_id, status)
             return status
             
         except httpx.TimeoutException:
             logger.error("Timeout while checking container status")
             return 'ERROR'
         except httpx.HTTPError as e:
-            logger.error(f"HTTP error checking container status: {e}")
+            logger.error("HTTP error checking container status: %s", e)
             return 'ERROR'
         except Exception as e:
-            logger.error(f"Unexpected error checking container status: {e}", exc_info=True)
+            logger.error("Unexpected error checking container status: %s", e, exc_info=True)
             return 'ERROR'
     
     async def publish_container(self, container_id: str) -> Optional[str]:
         try:
-            logger.info(f"Publishing container: {container_id}")
+            logger.info("Publishing container: %s", container_id)
             endpoint = f"{self.base_url}/{self.ig_user_id}/media_publish"
-            params = {
-                'access_token': self.access_token,
-                'creation_id': container_id
-            }
-            
-            response = await self.client.post(endpoint, params=params)
-            response.raise_for_status()
+            body = self._publish_body_prefix + b'&' + urlencode({'creation_id': container_id}).encode()
             
-            media_id = response.json().get('id')
-            logger.info(f"Video published successfully with media ID: {media_id}")
-            return media_id
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                try:
+                    response = await self.client.post(endpoint, content=body, headers=self.FORM_HEADERS)
+                    response.raise_for_status()
+                    media_id = orjson.loads(response.content).get('id')
+                    logger.info("Video published successfully with media ID: %s", media_id)
+                    return media_id
+                except httpx.HTTPError as e:
+                    if not self._is_retryable(e):
+                        raise
+                    # Publishing isn't idempotent: a lost response may still have published the video
+                    status = await self.check_container_status(container_id)
+                    if status == 'PUBLISHED':
+                        logger.info("Container %s was published despite the failed response", container_id)
+                        return await self._latest_media_id()
+                    if status != 'FINISHED' or attempt == MAX_ATTEMPTS:
+                        raise
+                    retry_after = parse_retry_after(e.response.headers) if isinstance(e, httpx.HTTPStatusError) else None
+                    delay = backoff_delay(attempt, retry_after)
+                    logger.warning("Publish of %s failed (attempt %s/%s), container not published; retrying in %.1fs", container_id, attempt, MAX_ATTEMPTS, delay)
+                    await asyncio.sleep(delay)
             
         except httpx.TimeoutException:
             logger.error("Timeout while publishing container")
             return None
         except httpx.HTTPError as e:
-            logger.error(f"HTTP error publishing container: {e}")
+            logger.error("HTTP error publishing container: %s", e)
             return None
         except Exception as e:
-            logger.error(f"Unexpected error publishing container: {e}", exc_info=True)
+            logger.error("Unexpected error publishing container: %s", e, exc_info=True)
+            return None
+    
+    async def _latest_media_id(self) -> Optional[str]:
+        """Look up the account's most recent media, used when a publish response was lost"""
+        try:
+            endpoint = f"{self.base_url}/{self.ig_user_id}/media"
+            params = {
+                'fields': 'id',
+                'limit': 1,
+                'access_token': self.access_token
+            }
+            
+            response = await self._request('GET', endpoint, params=params)
+            
+            data = orjson.loads(response.content).get('data') or []
+            media_id = data[0].get('id') if data else None
+            logger.info("Recovered published media ID: %s", media_id)
+            return media_id
+            
+        except Exception as e:
+            logger.error("Container was published but its media ID could not be fetched: %s", e)
             return None
     
     async def post_video(self, video_url: str, caption: str, max_wait_time: int = 600) -> Dict[str, Any]:
@@ -119,8 +201,8 @@ class InstagramPoster:
         
         try:
             logger.info("Starting async video post process")
-            logger.info(f"Video URL: {video_url[:50]}...")
-            logger.info(f"Caption length: {len(caption)} characters")
+            logger.info("Video URL: %s...", video_url[:50])
+            logger.info("Caption length: %s characters", len(caption))
             
             container_id = await self.create_video_container(video_url, caption)
             if not container_id:
@@ -128,10 +210,11 @@ class InstagramPoster:
                 logger.error(result['error'])
                 return result
             
-            start_time = asyncio.get_event_loop().time()
-            check_interval = 5  # Check every 5 seconds for faster response
+            loop = asyncio.get_running_loop()
+            start_time = loop.time()
+            delay = self.POLL_INITIAL_DELAY
             
-            while asyncio.get_event_loop().time() - start_time < max_wait_time:
+            while loop.time() - start_time < max_wait_time:
                 status = await self.check_container_status(container_id)
                 
                 if status == 'FINISHED':
@@ -140,7 +223,7 @@ class InstagramPoster:
                     if media_id:
                         result['success'] = True
                         result['media_id'] = media_id
-                        logger.info(f"Post completed successfully: {media_id}")
+                        logger.info("Post completed successfully: %s", media_id)
                         return result
                     else:
                         result['error'] = 'Failed to publish container'
@@ -152,11 +235,12 @@ class InstagramPoster:
                     logger.error(result['error'])
                     return result
                 
-                logger.info(f"Container status: {status}. Waiting {check_interval}s...")
-                await asyncio.sleep(check_interval)
+                logger.info("Container status: %s. Waiting %.0fs...", status, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.POLL_MAX_DELAY)
             
             result['error'] = 'Container processing timeout'
-            logger.error(f"Container processing exceeded {max_wait_time} seconds")
+            logger.error("Container processing exceeded %s seconds", max_wait_time)
             return result
         
         except Exception as e:
@@ -164,7 +248,90 @@ class InstagramPoster:
             logger.error(result['error'], exc_info=True)
             return result
     
+    async def post_videos_batch(self, jobs: List[Tuple[str, str]], max_wait_time: int = 600) -> List[Dict[str, Any]]:
+        """
+        Post several videos, letting Meta process their containers in parallel
+        
+        Args:
+            jobs: List of (video_url, caption) pairs
+            max_wait_time: Maximum seconds to wait for containers to finish processing
+            
+        Returns:
+            One result dictionary per job, in the same order as jobs
+        """
+        results = [{'success': False, 'media_id': None, 'error': None} for _ in jobs]
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        
+        async def bounded(func, *args):
+            async with semaphore:
+                return await func(*args)
+        
+        try:
+            logger.info("Starting batch post of %s videos", len(jobs))
+            
+            container_ids = await asyncio.gather(
+                *(bounded(self.create_video_container, video_url, caption) for video_url, caption in jobs)
+            )
+            
+            pending = {}
+            for index, container_id in enumerate(container_ids):
+                if container_id:
+                    pending[index] = container_id
+                else:
+                    results[index]['error'] = 'Failed to create video container'
+            
+            loop = asyncio.get_running_loop()
+            start_time = loop.time()
+            delay = self.POLL_INITIAL_DELAY
+            
+            while pending and loop.time() - start_time < max_wait_time:
+                indexes = list(pending)
+                statuses = await asyncio.gather(
+                    *(bounded(self.check_container_status, pending[index]) for index in indexes)
+                )
+                
+                finished = []
+                for index, status in zip(indexes, statuses):
+                    if status == 'FINISHED':
+                        finished.append(index)
+                    elif status == 'ERROR':
+                        results[index]['error'] = 'Container processing error'
+                        del pending[index]
+                
+                if finished:
+                    media_ids = await asyncio.gather(
+                        *(bounded(self.publish_container, pending[index]) for index in finished)
+                    )
+                    for index, media_id in zip(finished, media_ids):
+                        if media_id:
+                            results[index]['success'] = True
+                            results[index]['media_id'] = media_id
+                        else:
+                            results[index]['error'] = 'Failed to publish container'
+                        del pending[index]
+                
+                if pending:
+                    logger.info("%s containers still processing. Waiting %.0fs...", len(pending), delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.POLL_MAX_DELAY)
+            
+            for index in pending:
+                results[index]['error'] = 'Container processing timeout'
+            
+            published = sum(1 for result in results if result['success'])
+            logger.info("Batch post completed: %s/%s videos published", published, len(jobs))
+            return results
+        
+        except Exception as e:
+            logger.error("Unexpected error in post_videos_batch: %s", e, exc_info=True)
+            for result in results:
+                if not result['success'] and not result['error']:
+                    result['error'] = f'Unexpected error in post_videos_batch: {str(e)}'
+            return results
+    
     async def close(self):
-        """Close HTTP client connection pool"""
+        """Close the shared HTTP client connection pool"""
         await self.client.aclose()
+        if InstagramPoster._client is self.client:
+            InstagramPoster._client = None
         logger.info("Instagram Poster HTTP client closed")
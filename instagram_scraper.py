@@ -1,22 +1,23 @@
-import os
+import asyncio
+import heapq
 import logging
 import random
+from operator import itemgetter
 from typing import List, Dict, Optional
 from pathlib import Path
+from cachetools import TTLCache
 from instagrapi import Client
 from instagrapi.exceptions import LoginRequired, PleaseWaitFewMinutes
-from dotenv import load_dotenv
-
-load_dotenv()
+import config
 
 logger = logging.getLogger(__name__)
 
 class InstagramScraper:
     def __init__(self):
         logger.info("Initializing Instagram Scraper")
-        self.username = os.getenv('INSTAGRAM_SCRAPER_USERNAME', '')
-        self.password = os.getenv('INSTAGRAM_SCRAPER_PASSWORD', '')
-        self.session_file = os.getenv('INSTAGRAM_SESSION_FILE', 'instagram_session.json')
+        self.username = config.INSTAGRAM_SCRAPER_USERNAME
+        self.password = config.INSTAGRAM_SCRAPER_PASSWORD
+        self.session_file = config.INSTAGRAM_SESSION_FILE
         
         if not self.username or not self.password:
             logger.error("INSTAGRAM_SCRAPER_USERNAME and INSTAGRAM_SCRAPER_PASSWORD must be set")
@@ -25,6 +26,10 @@ class InstagramScraper:
         self.client = Client()
         self.client.delay_range = [2, 5]
         
+        # Explore barely changes between nearby cycles; reuse recent results keyed by count
+        explore_cache_ttl = config.EXPLORE_CACHE_TTL
+        self._explore_cache = TTLCache(maxsize=4, ttl=explore_cache_ttl)
+        
         # Load or create session
         self._login()
         logger.info("Instagram Scraper initialized successfully")
@@ -39,11 +44,14 @@ class InstagramScraper:
                 logger.info("Loading existing Instagram session")
                 try:
                     self.client.load_settings(session_path)
-                    self.client.login(self.username, self.password)
-                    logger.info("Successfully loaded existing session")
+                    # Stored cookies usually still authenticate; a cheap call avoids a full login
+                    self.client.account_info()
+                    logger.info("Existing session is valid, skipping login")
                     return
+                except LoginRequired:
+                    logger.info("Stored session expired. Creating new session...")
                 except Exception as e:
-                    logger.warning(f"Failed to load session: {e}. Creating new session...")
+                    logger.warning("Failed to load session: %s. Creating new session...", e)
             
             # Create new session
             logger.info("Creating new Instagram session")
@@ -52,27 +60,37 @@ class InstagramScraper:
             logger.info("New session created and saved")
             
         except LoginRequired as e:
-            logger.error(f"Login required: {e}")
+            logger.error("Login required: %s", e)
             raise
         except PleaseWaitFewMinutes as e:
-            logger.error(f"Rate limited: {e}")
+            logger.error("Rate limited: %s", e)
             raise
         except Exception as e:
-            logger.error(f"Login failed: {e}", exc_info=True)
+            logger.error("Login failed: %s", e, exc_info=True)
             raise
     
-    def get_explore_videos(self, count: int = 50) -> List[Dict]:
+    async def get_explore_videos(self, count: int = 50, refresh: bool = False) -> List[Dict]:
+        """Fetch Explore videos without blocking the event loop (see _sync_get_explore_videos)"""
+        return await asyncio.to_thread(self._sync_get_explore_videos, count, refresh)
+    
+    def _sync_get_explore_videos(self, count: int = 50, refresh: bool = False) -> List[Dict]:
         """
         Fetch video posts from Instagram Explore page
         
         Args:
             count: Number of posts to fetch (default: 50)
+            refresh: Bypass the cached Explore results
             
         Returns:
             List of video post dictionaries with metadata
         """
         try:
-            logger.info(f"Fetching {count} videos from Explore page")
+            if not refresh and count in self._explore_cache:
+                video_posts = self._explore_cache[count]
+                logger.info("Using %s cached Explore videos", len(video_posts))
+                return list(video_posts)
+            
+            logger.info("Fetching %s videos from Explore page", count)
             
             # Get explore medias
             medias = self.client.get_explore_media(count)
@@ -84,12 +102,13 @@ class InstagramScraper:
                     video_info = {
                         'media_id': media.pk,
                         'code': media.code,
-                        'video_url': media.video_url if hasattr(media, 'video_url') else None,
+                        'video_url': getattr(media, 'video_url', None),
                         'thumbnail_url': media.thumbnail_url,
-                        'caption': media.caption_text if media.caption_text else '',
-                        'like_count': media.like_count,
-                        'view_count': media.view_count if hasattr(media, 'view_count') else 0,
-                        'comment_count': media.comment_count,
+                        'caption': media.caption_text or '',
+                        # Counts are always ints so filter_viral_videos can index them directly
+                        'like_count': media.like_count or 0,
+                        'view_count': getattr(media, 'view_count', 0) or 0,
+                        'comment_count': media.comment_count or 0,
                         'taken_at': media.taken_at,
                         'user': {
                             'username': media.user.username,
@@ -99,17 +118,20 @@ class InstagramScraper:
                     }
                     video_posts.append(video_info)
             
-            logger.info(f"Found {len(video_posts)} video posts from Explore")
-            return video_posts
+            logger.info("Found %s video posts from Explore", len(video_posts))
+            if video_posts:
+                self._explore_cache[count] = video_posts
+            return list(video_posts)
             
         except Exception as e:
-            logger.error(f"Error fetching explore videos: {e}", exc_info=True)
+            logger.error("Error fetching explore videos: %s", e, exc_info=True)
             return []
     
     def filter_viral_videos(self, videos: List[Dict], 
                            min_likes: Optional[int] = None,
                            min_views: Optional[int] = None,
-                           min_engagement_rate: Optional[float] = None) -> List[Dict]:
+                           min_engagement_rate: Optional[float] = None,
+                           top_n: Optional[int] = None) -> List[Dict]:
         """
         Filter videos based on virality criteria
         
@@ -118,63 +140,74 @@ class InstagramScraper:
             min_likes: Minimum number of likes (from env or default)
             min_views: Minimum number of views (from env or default)
             min_engagement_rate: Minimum engagement rate (from env or default)
+            top_n: Only return the N most engaging videos
             
         Returns:
             Filtered list of viral videos sorted by engagement
         """
+        if not videos:
+            return []
+        
         try:
             # Load filters from environment with defaults
-            min_likes = min_likes or int(os.getenv('MIN_LIKES', '10000'))
-            min_views = min_views or int(os.getenv('MIN_VIEWS', '50000'))
-            min_engagement_rate = min_engagement_rate or float(os.getenv('MIN_ENGAGEMENT_RATE', '0.05'))
+            min_likes = min_likes or config.MIN_LIKES
+            min_views = min_views or config.MIN_VIEWS
+            min_engagement_rate = min_engagement_rate or config.MIN_ENGAGEMENT_RATE
             
-            logger.info(f"Filtering videos: min_likes={min_likes}, min_views={min_views}, engagement_rate={min_engagement_rate}")
+            logger.info("Filtering videos: min_likes=%s, min_views=%s, engagement_rate=%s", min_likes, min_views, min_engagement_rate)
             
-            viral_videos = []
+            candidates = []
+            add_candidate = candidates.append
             for video in videos:
-                likes = video.get('like_count', 0)
-                views = video.get('view_count', 0)
-                comments = video.get('comment_count', 0)
+                likes = video['like_count']
+                views = video['view_count']
                 
                 # Calculate engagement rate
-                if views > 0:
-                    engagement_rate = (likes + comments) / views
-                else:
-                    engagement_rate = 0
+                engagement_rate = (likes + video['comment_count']) / views if views > 0 else 0.0
                 
                 # Apply filters
                 if likes >= min_likes and views >= min_views and engagement_rate >= min_engagement_rate:
-                    video['engagement_rate'] = engagement_rate
-                    viral_videos.append(video)
+                    add_candidate((engagement_rate, video))
             
-            # Sort by engagement rate (highest first)
-            viral_videos.sort(key=lambda x: x['engagement_rate'], reverse=True)
+            # Rank by engagement rate (highest first); nlargest avoids sorting everything for a small top_n
+            if top_n is not None:
+                ranked = heapq.nlargest(top_n, candidates, key=itemgetter(0))
+            else:
+                ranked = sorted(candidates, key=itemgetter(0), reverse=True)
+            viral_videos = [video for _, video in ranked]
             
-            logger.info(f"Found {len(viral_videos)} viral videos after filtering")
+            logger.info("Found %s viral videos after filtering", len(candidates))
             return viral_videos
             
         except Exception as e:
-            logger.error(f"Error filtering viral videos: {e}", exc_info=True)
+            logger.error("Error filtering viral videos: %s", e, exc_info=True)
             return videos
     
-    def get_random_viral_video(self) -> Optional[Dict]:
+    async def get_random_viral_video(self, refresh: bool = False) -> Optional[Dict]:
+        """Pick a viral video without blocking the event loop (see _sync_get_random_viral_video)"""
+        return await asyncio.to_thread(self._sync_get_random_viral_video, refresh)
+    
+    def _sync_get_random_viral_video(self, refresh: bool = False) -> Optional[Dict]:
         """
         Get a random viral video from Explore page
         
+        Args:
+            refresh: Bypass the cached Explore results
+            
         Returns:
             Dictionary with video information or None
         """
         try:
             # Fetch explore videos
-            explore_count = int(os.getenv('EXPLORE_FETCH_COUNT', '50'))
-            videos = self.get_explore_videos(count=explore_count)
+            explore_count = config.EXPLORE_FETCH_COUNT
+            videos = self._sync_get_explore_videos(count=explore_count, refresh=refresh)
             
             if not videos:
                 logger.warning("No videos found in Explore")
                 return None
             
             # Filter for viral videos
-            viral_videos = self.filter_viral_videos(videos)
+            viral_videos = self.filter_viral_videos(videos, top_n=5)
             
             if not viral_videos:
                 logger.warning("No viral videos found after filtering")
@@ -183,13 +216,13 @@ class InstagramScraper:
             
             # Select random from top viral videos
             selected = random.choice(viral_videos[:5])  # Choose from top 5
-            logger.info(f"Selected video: {selected['code']} by @{selected['user']['username']}")
-            logger.info(f"Stats - Likes: {selected['like_count']}, Views: {selected.get('view_count', 'N/A')}")
+            logger.info("Selected video: %s by @%s", selected['code'], selected['user']['username'])
+            logger.info("Stats - Likes: %s, Views: %s", selected['like_count'], selected.get('view_count', 'N/A'))
             
             return selected
             
         except Exception as e:
-            logger.error(f"Error getting random viral video: {e}", exc_info=True)
+            logger.error("Error getting random viral video: %s", e, exc_info=True)
             return None
     
     def logout(self):
@@ -198,4 +231,4 @@ class InstagramScraper:
             logger.info("Logging out from Instagram")
             self.client.logout()
         except Exception as e:
-            logger.error(f"Error during logout: {e}")
+            logger.error("Error during logout: %s", e)
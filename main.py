@@ -1,12 +1,13 @@
 import os
+import signal
 import asyncio
 import logging
-from dotenv import load_dotenv
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HypercornConfig
+import config
+import server
 from scheduler import AutoRepostScheduler
-from credit_monitor import CreditMonitor
-from telegram_notifier import TelegramNotifier
-
-load_dotenv()
+from telegram_notifier import get_notifier
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -14,23 +15,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+REQUIRED_VARS = frozenset({
+    'INSTAGRAM_ACCESS_TOKEN',
+    'INSTAGRAM_USER_ID',
+    'INSTAGRAM_SCRAPER_USERNAME',
+    'INSTAGRAM_SCRAPER_PASSWORD',
+    'OPENAI_API_KEY',
+    'TELEGRAM_BOT_TOKEN',
+    'TELEGRAM_CHAT_ID',
+    'TRIGGER_API_KEY'
+})
+
+async def serve_http(shutdown_trigger):
+    """Serve the HTTP endpoints; a failure here is logged instead of stopping the bot"""
+    server_config = HypercornConfig()
+    server_config.bind = [f"0.0.0.0:{config.PORT}"]
+    try:
+        await serve(server.app, server_config, shutdown_trigger=shutdown_trigger)
+    except OSError as e:
+        logger.error(f"HTTP server failed on port {config.PORT}: {e}")
+        logger.warning("Bot will continue without the HTTP endpoints")
+
 async def main():
     try:
         logger.info("🚀 Starting Instagram Auto-Repost Bot with Viral Video Scraping...")
         logger.info("Loading environment variables from .env file")
         
-        required_vars = [
-            'INSTAGRAM_ACCESS_TOKEN',
-            'INSTAGRAM_USER_ID',
-            'INSTAGRAM_SCRAPER_USERNAME',
-            'INSTAGRAM_SCRAPER_PASSWORD',
-            'OPENAI_API_KEY',
-            'TELEGRAM_BOT_TOKEN',
-            'TELEGRAM_CHAT_ID',
-            'TRIGGER_API_KEY'
-        ]
+        # Python 3.12+: new tasks run synchronously up to their first real await
+        if hasattr(asyncio, 'eager_task_factory'):
+            asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
         
-        missing_vars = [var for var in required_vars if not os.getenv(var)]
+        # Blank values left over from .env.example count as missing too
+        missing_vars = sorted(var for var in REQUIRED_VARS if not os.environ.get(var))
         if missing_vars:
             logger.error(f"Missing required environment variables: {', '.join(missing_vars)}")
             logger.error("Please configure .env file with all required variables")
@@ -41,55 +57,90 @@ async def main():
         # Initialize components concurrently for faster startup
         telegram = None
         try:
-            telegram = TelegramNotifier()
+            telegram = get_notifier()
             await telegram.send_notification("🚀 Instagram Auto-Repost Bot Started", "success")
-            logger.info("✅ Telegram notifier initialized and test notification sent")
+            logger.info("✅ Telegram notifier initialized and startup notification queued")
         except Exception as e:
             logger.error(f"Failed to initialize Telegram notifier: {e}")
             logger.warning("Bot will continue but notifications will not be sent")
         
-        # Start credit monitor and scheduler concurrently
-        tasks = []
-        
-        try:
-            credit_monitor = CreditMonitor()
-            tasks.append(credit_monitor.start_monitoring())
-            logger.info("✅ Credit monitor started")
-        except Exception as e:
-            logger.error(f"Failed to start credit monitor: {e}")
-            logger.warning("Bot will continue without credit monitoring")
+        # Background tasks run until SIGINT/SIGTERM sets the stop event
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                # Windows event loops lack signal handlers; Ctrl+C still raises KeyboardInterrupt
+                pass
         
+        scheduler = None
         try:
-            scheduler = AutoRepostScheduler()
-            await scheduler.start()
-            logger.info("✅ Auto-Repost scheduler started successfully")
-            logger.info(f"   Will automatically find and repost viral videos every {os.getenv('POSTING_INTERVAL_HOURS', '3')} hours")
-        except Exception as e:
-            logger.error(f"Failed to start scheduler: {e}")
-            logger.error("Bot cannot continue without scheduler")
-            if telegram:
-                await telegram.send_notification(f"❌ Failed to start scheduler: {e}", "error")
-            return
+            # The task group cancels its siblings if any background task fails
+            async with asyncio.TaskGroup() as tg:
+                try:
+                    # Shared with the HTTP endpoints so both drive the same monitor
+                    credit_monitor = server.get_credit_monitor()
+                    await credit_monitor.start_monitoring(task_group=tg)
+                    logger.info("✅ Credit monitor started")
+                except Exception as e:
+                    logger.error(f"Failed to start credit monitor: {e}")
+                    logger.warning("Bot will continue without credit monitoring")
+                
+                try:
+                    scheduler = AutoRepostScheduler(telegram=telegram)
+                    await scheduler.start(task_group=tg)
+                    server.scheduler_instance = scheduler
+                    logger.info("✅ Auto-Repost scheduler started successfully")
+                    logger.info(f"   Will automatically find and repost viral videos every {config.POSTING_INTERVAL_HOURS} hours")
+                except Exception as e:
+                    logger.error(f"Failed to start scheduler: {e}")
+                    logger.error("Bot cannot continue without scheduler")
+                    if telegram:
+                        await telegram.send_notification(f"❌ Failed to start scheduler: {e}", "error")
+                    stop_event.set()
+                
+                if not stop_event.is_set():
+                    # Serve the HTTP endpoints on this loop; hypercorn shuts down once the stop event is set
+                    tg.create_task(serve_http(stop_event.wait))
+                    logger.info(f"✅ HTTP server starting on port {config.PORT}")
+                    
+                    logger.info("⚡ Bot running and scraping viral videos. Press Ctrl+C to stop.")
+                
+                await stop_event.wait()
+                
+                logger.info("Shutting down bot...")
+                for task in (getattr(scheduler, 'scheduler_task', None), getattr(credit_monitor, 'monitor_task', None)):
+                    if task:
+                        task.cancel()
+        except* Exception as eg:
+            for error in eg.exceptions:
+                logger.error(f"Background task failed: {error}", exc_info=error)
         
-        logger.info("⚡ Bot running and scraping viral videos. Press Ctrl+C to stop.")
+        if telegram and getattr(scheduler, 'scheduler_task', None):
+            await telegram.send_notification("🛑 Instagram Auto-Repost Bot Stopped", "info")
         
-        # Run all background tasks concurrently
-        try:
-            await asyncio.gather(*tasks, asyncio.sleep(float('inf')))
-        except KeyboardInterrupt:
-            logger.info("Shutting down bot...")
-            if telegram:
-                await telegram.send_notification("🛑 Instagram Auto-Repost Bot Stopped", "info")
-            
-            # Cleanup
+        # Cleanup
+        if scheduler:
             try:
                 await scheduler.cleanup()
-            except:
-                pass
+            except Exception as e:
+                logger.error(f"Error during scheduler cleanup: {e}")
+        
+        # Flush anything still waiting in the notification queue
+        if telegram:
+            await telegram.close()
     
     except Exception as e:
         logger.error(f"Critical error in main: {e}", exc_info=True)
         raise
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop")
+    except ImportError:
+        logger.info("uvloop not available, using default asyncio event loop")
+    
     asyncio.run(main())
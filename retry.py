@@ -0,0 +1,45 @@
+import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional, Mapping
+
+# Status codes worth retrying: rate limiting and transient server-side errors
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 529})
+MAX_ATTEMPTS = 5
+BACKOFF_MULTIPLIER = 2.0
+BACKOFF_MAX = 60.0
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Return the Retry-After delay in seconds, if the server sent one"""
+    if not headers:
+        return None
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter
+
+    Args:
+        attempt: Number of the attempt that just failed (starting at 1)
+        retry_after: Delay requested by the server, honored when present
+
+    Returns:
+        Seconds to wait before the next attempt
+    """
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_MULTIPLIER * 2 ** attempt))
@@ -2,10 +2,7 @@
 
 echo "Starting Instagram Automation Bot..."
 
-python server.py &
-SERVER_PID=$!
-echo "Flask server started (PID: $SERVER_PID)"
-
+# main.py also serves the HTTP endpoints, so server.py no longer runs separately
 python main.py &
 BOT_PID=$!
 echo "Instagram bot started (PID: $BOT_PID)"
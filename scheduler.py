@@ -1,59 +1,80 @@
-import os
 import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Optional
 from instagram_poster import InstagramPoster
-from telegram_notifier import TelegramNotifier
+from telegram_notifier import TelegramNotifier, get_notifier
 from caption_generator import CaptionGenerator
 from instagram_scraper import InstagramScraper
 from video_downloader import VideoDownloader
-from dotenv import load_dotenv
-
-load_dotenv()
+import config
 
 logger = logging.getLogger(__name__)
 
 class AutoRepostScheduler:
-    def __init__(self):
+    def __init__(self, telegram: Optional[TelegramNotifier] = None):
+        """
+        Initialize the scheduler
+        
+        Args:
+            telegram: Existing notifier to reuse (defaults to the shared notifier)
+        """
         logger.info("Initializing Auto-Repost Scheduler")
         
         self.poster = None
-        self.telegram = None
-        self.caption_gen = CaptionGenerator()
+        self.telegram = telegram
+        # Built on first use so startup doesn't pay for the OpenAI client
+        self._caption_gen: Optional[CaptionGenerator] = None
         self.scraper = None
         self.downloader = None
         
         # Get posting interval from env (default: 3 hours = 10800 seconds)
-        self.posting_interval = int(os.getenv('POSTING_INTERVAL_HOURS', '3')) * 3600
+        self.posting_interval = config.POSTING_INTERVAL
         logger.info(f"Posting interval: {self.posting_interval / 3600} hours")
         
         self.last_post_time = None
+        # Monotonic loop time of the last post; drives scheduling so clock changes can't skew it
+        self._last_post_monotonic: Optional[float] = None
+        # Set after a failed post so the next cycle fetches a fresh Explore feed
+        self.refresh_explore = False
+        # Set by post_now() to wake the scheduler before the interval elapses
+        self._trigger = asyncio.Event()
+        self.scheduler_task = None
+        # Strong references to fire-and-forget notifications so they are not garbage collected
+        self._background_tasks = set()
     
-    async def initialize(self):
-        """Initialize async components"""
-        try:
-            # Initialize Instagram poster
-            self.poster = InstagramPoster()
-            logger.info("Instagram Poster initialized in scheduler")
-        except Exception as e:
-            logger.error(f"Failed to initialize Instagram Poster: {e}")
-            raise
-        
+    @property
+    def caption_gen(self) -> CaptionGenerator:
+        if self._caption_gen is None:
+            self._caption_gen = CaptionGenerator()
+        return self._caption_gen
+    
+    async def _init_component(self, name: str, factory):
+        """Construct a component in a worker thread, since constructors may block on logins"""
         try:
-            # Initialize Telegram notifier
-            self.telegram = TelegramNotifier()
-            logger.info("Telegram Notifier initialized in scheduler")
+            component = await asyncio.to_thread(factory)
+            logger.info(f"{name} initialized in scheduler")
+            return component
         except Exception as e:
-            logger.error(f"Failed to initialize Telegram Notifier: {e}")
+            logger.error(f"Failed to initialize {name}: {e}")
             raise
+    
+    def _notify_in_background(self, coro):
+        """Send a Telegram message without holding up the repost cycle"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def initialize(self):
+        """Initialize async components"""
+        # Poster and scraper are independent, so their handshakes run concurrently
+        self.poster, self.scraper = await asyncio.gather(
+            self._init_component("Instagram Poster", InstagramPoster),
+            self._init_component("Instagram Scraper", InstagramScraper)
+        )
         
-        try:
-            # Initialize Instagram scraper
-            self.scraper = InstagramScraper()
-            logger.info("Instagram Scraper initialized in scheduler")
-        except Exception as e:
-            logger.error(f"Failed to initialize Instagram Scraper: {e}")
-            raise
+        if self.telegram is None:
+            self.telegram = await self._init_component("Telegram Notifier", get_notifier)
         
         try:
             # Initialize video downloader (reuse scraper's client)
@@ -68,20 +89,21 @@ class AutoRepostScheduler:
         try:
             start_time = datetime.now()
             logger.info("=" * 60)
-            logger.info(f"Starting new repost cycle at {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+            logger.info(f"Starting new repost cycle at {start_time.isoformat(sep=' ', timespec='seconds')}")
             logger.info("=" * 60)
             
             # Step 1: Find a viral video from Explore
             logger.info("Step 1: Fetching viral video from Instagram Explore")
-            video_info = self.scraper.get_random_viral_video()
+            video_info = await self.scraper.get_random_viral_video(refresh=self.refresh_explore)
+            self.refresh_explore = False
             
             if not video_info:
                 error_msg = "Failed to find viral video from Explore"
                 logger.error(error_msg)
-                await self.telegram.send_notification(
+                self._notify_in_background(self.telegram.send_notification(
                     f"❌ {error_msg}",
                     "error"
-                )
+                ))
                 return
             
             video_title = f"{video_info['caption'][:50]}..." if video_info['caption'] else f"Video by @{video_info['user']['username']}"
@@ -89,30 +111,50 @@ class AutoRepostScheduler:
             logger.info(f"   Author: @{video_info['user']['username']}")
             logger.info(f"   Likes: {video_info['like_count']:,}, Views: {video_info.get('view_count', 'N/A')}")
             
-            # Step 2: Download video
+            # Steps 2 and 3 are independent, so the download and caption generation run concurrently
             logger.info("Step 2: Downloading video without watermark")
-            video_path = self.downloader.download_video(
-                media_id=video_info['media_id'],
-                video_code=video_info['code']
+            logger.info("Step 3: Generating AI-powered caption")
+            video_context = f"{video_info['caption'][:200]}" if video_info['caption'] else f"Viral video by {video_info['user']['username']}"
+            video_path, caption = await asyncio.gather(
+                asyncio.to_thread(
+                    self.downloader.download_video,
+                    media_id=video_info['media_id'],
+                    video_code=video_info['code']
+                ),
+                self.caption_gen.generate_caption(video_context=video_context),
+                return_exceptions=True
             )
             
+            # return_exceptions also hands back a cancelled child's CancelledError, which is only a BaseException
+            if isinstance(video_path, BaseException):
+                logger.error(f"Video download raised an error: {video_path}")
+                video_path = None
+            
+            if not video_path and video_info.get('video_url'):
+                logger.warning("instagrapi download failed, falling back to the direct video URL")
+                video_path = await asyncio.to_thread(
+                    self.downloader.download_video_from_url,
+                    str(video_info['video_url']),
+                    filename=f"{video_info['code']}.mp4"
+                )
+            
             if not video_path:
                 error_msg = f"Failed to download video {video_info['code']}"
                 logger.error(error_msg)
-                await self.telegram.send_notification(
+                self._notify_in_background(self.telegram.send_notification(
                     f"❌ {error_msg}",
                     "error"
-                )
+                ))
                 return
             
-            video_file_info = self.downloader.get_video_info(video_path)
+            # File metadata and cleanup touch the disk, so they stay off the event loop too
+            video_file_info = await asyncio.to_thread(self.downloader.get_video_info, video_path)
             logger.info(f"✅ Video downloaded: {video_file_info.get('filename', 'unknown')}")
-            logger.info(f"   Size: {video_file_info.get('size_mb', 0)} MB")
+            logger.info(f"   Size: {video_file_info.get('size_mb', 0):.2f} MB")
             
-            # Step 3: Generate AI caption
-            logger.info("Step 3: Generating AI-powered caption")
-            video_context = f"{video_info['caption'][:200]}" if video_info['caption'] else f"Viral video by {video_info['user']['username']}"
-            caption = self.caption_gen.generate_caption(video_context=video_context)
+            if isinstance(caption, BaseException):
+                logger.error(f"Caption generation raised an error: {caption}. Using template caption")
+                caption = self.caption_gen.generate_template_caption()
             logger.info(f"✅ Caption generated (length: {len(caption)} chars)")
             
             # Step 4: Upload video to hosting (we need a public URL)
@@ -123,7 +165,7 @@ class AutoRepostScheduler:
             
             # For demo purposes, we'll use the downloaded video path
             # In real implementation, upload to CDN and get public URL
-            video_url = os.getenv('VIDEO_URL', f'https://example.com/{video_file_info.get("filename", "video.mp4")}')
+            video_url = config.VIDEO_URL or f'https://example.com/{video_file_info.get("filename", "video.mp4")}'
             
             # Step 5: Post to Instagram
             logger.info("Step 5: Posting video to Instagram")
@@ -137,7 +179,7 @@ class AutoRepostScheduler:
                 logger.info(f"✅ Successfully posted video in {duration:.1f} seconds")
                 logger.info(f"   Media ID: {result['media_id']}")
                 
-                await self.telegram.send_post_report(
+                self._notify_in_background(self.telegram.send_post_report(
                     video_title=video_title,
                     video_author=f"@{video_info['user']['username']}",
                     likes=video_info['like_count'],
@@ -147,14 +189,15 @@ class AutoRepostScheduler:
                     media_id=result['media_id'],
                     timestamp=start_time,
                     duration=duration
-                )
+                ))
                 
                 # Clean up old videos to save space
-                self.downloader.cleanup_old_videos(keep_latest=5)
+                await asyncio.to_thread(self.downloader.cleanup_old_videos, keep_latest=5)
                 
             else:
                 logger.error(f"❌ Failed to post video: {result['error']}")
-                await self.telegram.send_post_report(
+                self.refresh_explore = True
+                self._notify_in_background(self.telegram.send_post_report(
                     video_title=video_title,
                     video_author=f"@{video_info['user']['username']}",
                     likes=video_info['like_count'],
@@ -164,19 +207,16 @@ class AutoRepostScheduler:
                     error=result['error'],
                     timestamp=start_time,
                     duration=duration
-                )
+                ))
             
             logger.info("=" * 60)
             
         except Exception as e:
             logger.error(f"Unexpected error in find_and_post_viral_video: {e}", exc_info=True)
-            try:
-                await self.telegram.send_notification(
-                    f"❌ Critical error during repost cycle: {str(e)}",
-                    "error"
-                )
-            except Exception as notify_error:
-                logger.error(f"Failed to send error notification: {notify_error}")
+            self._notify_in_background(self.telegram.send_notification(
+                f"❌ Critical error during repost cycle: {str(e)}",
+                "error"
+            ))
     
     async def run_scheduler(self):
         """Async scheduler loop - posts every N hours"""
@@ -192,57 +232,77 @@ class AutoRepostScheduler:
         except Exception as e:
             logger.error(f"Failed to send startup notification: {e}")
         
+        loop = asyncio.get_running_loop()
         while True:
             try:
-                current_time = datetime.now()
-                
-                # Check if it's time to post
-                should_post = False
-                
-                if self.last_post_time is None:
+                if self._last_post_monotonic is None:
                     # First run - post immediately
-                    should_post = True
                     logger.info("First run - posting immediately")
                 else:
-                    # Check if interval has passed
-                    time_since_last_post = (current_time - self.last_post_time).total_seconds()
-                    if time_since_last_post >= self.posting_interval:
-                        should_post = True
-                        logger.info(f"Interval passed ({time_since_last_post / 3600:.1f} hours) - posting now")
-                
-                if should_post:
-                    await self.find_and_post_viral_video()
-                    self.last_post_time = datetime.now()
+                    remaining = self.posting_interval - (loop.time() - self._last_post_monotonic)
                     
-                    # Calculate next post time
-                    next_post_time = self.last_post_time.timestamp() + self.posting_interval
-                    next_post_datetime = datetime.fromtimestamp(next_post_time)
-                    logger.info(f"Next post scheduled for: {next_post_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+                    if remaining > 0 and await self._wait_for_trigger(remaining):
+                        logger.info("Manual trigger received - posting now")
+                    else:
+                        logger.info(f"Interval passed ({self.posting_interval / 3600:.1f} hours) - posting now")
                 
-                # Sleep for 60 seconds before checking again
-                await asyncio.sleep(60)
+                self._trigger.clear()
+                await self.find_and_post_viral_video()
+                self._last_post_monotonic = loop.time()
+                self.last_post_time = datetime.now()
+                
+                # Wall-clock time is only used for the log message
+                next_post_datetime = self.last_post_time + timedelta(seconds=self.posting_interval)
+                logger.info(f"Next post scheduled for: {next_post_datetime.isoformat(sep=' ', timespec='seconds')}")
                 
             except Exception as e:
                 logger.error(f"Error in scheduler loop: {e}", exc_info=True)
                 await asyncio.sleep(60)
     
-    async def start(self):
-        """Start async scheduler"""
+    async def _wait_for_trigger(self, timeout: float) -> bool:
+        """Sleep until the next post is due, returning True if post_now() woke us early"""
+        try:
+            await asyncio.wait_for(self._trigger.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    def post_now(self):
+        """Wake the scheduler to run a repost cycle immediately"""
+        logger.info("Immediate repost requested")
+        self._trigger.set()
+    
+    async def start(self, task_group: Optional[asyncio.TaskGroup] = None) -> asyncio.Task:
+        """
+        Start async scheduler
+        
+        Args:
+            task_group: Task group to run the scheduler loop in (defaults to a standalone task)
+        """
         try:
             logger.info("Starting auto-repost scheduler")
             await self.initialize()
             
             # Create background task
-            asyncio.create_task(self.run_scheduler())
+            create_task = task_group.create_task if task_group else asyncio.create_task
+            self.scheduler_task = create_task(self.run_scheduler())
             logger.info("Auto-repost scheduler started successfully and running in background")
+            return self.scheduler_task
         except Exception as e:
             logger.error(f"Failed to start scheduler: {e}", exc_info=True)
             raise
     
     async def cleanup(self):
         """Cleanup resources"""
+        if self._background_tasks:
+            # Let queued notifications finish before the bot goes away
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
         if self.poster:
             await self.poster.close()
+        if self._caption_gen:
+            await self._caption_gen.close()
+        if self.downloader:
+            self.downloader.close()
         if self.scraper:
-            self.scraper.logout()
+            await asyncio.to_thread(self.scraper.logout)
         logger.info("Scheduler cleanup completed")
@@ -1,21 +1,18 @@
-import os
 import secrets
-from flask import Flask, send_file, jsonify, request
-from pathlib import Path
+from quart import Quart, send_file, jsonify, request
+import os
 import logging
-import asyncio
-from dotenv import load_dotenv
+import config
 from credit_monitor import CreditMonitor
+from download_tokens import generate_download_token, validate_download_token, invalidate_download_token
 
-load_dotenv()
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+# ASGI app; main.py serves it with hypercorn on the bot's own event loop
+app = Quart(__name__)
 credit_monitor_instance = None
-
-DOWNLOAD_TOKEN_FILE = 'download_token.txt'
+# Set by main.py once the scheduler is running so /post-now can wake it
+scheduler_instance = None
 
 def get_credit_monitor():
     global credit_monitor_instance
@@ -27,68 +24,44 @@ def get_credit_monitor():
             logger.error(f"Failed to create credit monitor: {e}")
     return credit_monitor_instance
 
-def generate_download_token() -> str:
-    try:
-        token = secrets.token_urlsafe(32)
-        with open(DOWNLOAD_TOKEN_FILE, 'w') as f:
-            f.write(token)
-        logger.info("Generated new download token")
-        return token
-    except Exception as e:
-        logger.error(f"Error generating download token: {e}")
-        raise
-
-def validate_download_token(provided_token: str) -> bool:
-    try:
-        token_path = Path(DOWNLOAD_TOKEN_FILE)
-        if not token_path.exists():
-            logger.warning("Download token file does not exist")
-            return False
-        with open(DOWNLOAD_TOKEN_FILE, 'r') as f:
-            stored_token = f.read().strip()
-        is_valid = provided_token == stored_token
-        logger.info(f"Download token validation: {is_valid}")
-        return is_valid
-    except Exception as e:
-        logger.error(f"Error validating download token: {e}")
-        return False
-
 def validate_trigger_key() -> bool:
-    try:
-        provided_key = request.headers.get('X-Trigger-Key', '')
-        expected_key = os.getenv('TRIGGER_API_KEY', '')
-        
-        if not expected_key:
-            logger.error("TRIGGER_API_KEY not set in environment - trigger endpoint disabled")
-            return False
-        
-        is_valid = provided_key == expected_key
-        logger.info(f"Trigger key validation: {is_valid}")
-        return is_valid
-    except Exception as e:
-        logger.error(f"Error validating trigger key: {e}")
+    provided_key = request.headers.get('X-Trigger-Key', '')
+    expected_key = config.TRIGGER_API_KEY
+    
+    if not expected_key:
+        logger.error("TRIGGER_API_KEY not set in environment - trigger endpoint disabled")
         return False
+    
+    # Constant-time comparison so the key cannot be recovered by timing responses
+    is_valid = secrets.compare_digest(provided_key.encode(), expected_key.encode())
+    logger.info(f"Trigger key validation: {is_valid}")
+    return is_valid
+
+@app.errorhandler(500)
+async def handle_internal_error(e):
+    # Single fallback for unhandled exceptions in any route; HTTP errors like 404 keep their defaults.
+    # Quart has already logged the traceback, so only the summary is logged here
+    error = getattr(e, 'original_exception', None) or e
+    logger.error(f"Unhandled error in {request.path}: {error}")
+    return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/')
-def index():
-    try:
-        logger.info("Index route accessed")
-        return jsonify({
-            'status': 'running',
-            'service': 'Instagram Automation Bot',
-            'endpoints': {
-                '/download-zip': 'GET with ?token=TOKEN - Download project package (secured)',
-                '/trigger-package': 'POST with X-Trigger-Key header - Manually trigger packaging (secured)',
-                '/health': 'Health check'
-            },
-            'security': 'All sensitive endpoints are protected with authentication'
-        })
-    except Exception as e:
-        logger.error(f"Error in index route: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+async def index():
+    logger.info("Index route accessed")
+    return jsonify({
+        'status': 'running',
+        'service': 'Instagram Automation Bot',
+        'endpoints': {
+            '/download-zip': 'GET with ?token=TOKEN - Download project package (secured)',
+            '/trigger-package': 'POST with X-Trigger-Key header - Manually trigger packaging (secured)',
+            '/post-now': 'POST with X-Trigger-Key header - Run a repost cycle immediately (secured)',
+            '/health': 'Health check'
+        },
+        'security': 'All sensitive endpoints are protected with authentication'
+    })
 
 @app.route('/download-zip')
-def download_zip():
+async def download_zip():
     try:
         logger.info("Download ZIP route accessed")
         provided_token = request.args.get('token', '')
@@ -98,25 +71,24 @@ def download_zip():
             return jsonify({'error': 'Invalid or missing download token'}), 403
         
         zip_file = 'instagram_bot_package.zip'
-        zip_path = Path(zip_file)
         
-        if not zip_path.exists():
+        try:
+            os.stat(zip_file)
+        except FileNotFoundError:
             logger.error("ZIP file not found")
             return jsonify({'error': 'ZIP file not found. Package not created yet.'}), 404
         
         logger.info("Authorized ZIP download in progress")
         
-        response = send_file(
+        response = await send_file(
             zip_file,
             mimetype='application/zip',
             as_attachment=True,
-            download_name='instagram_bot_package.zip'
+            attachment_filename='instagram_bot_package.zip'
         )
         
-        token_file = Path(DOWNLOAD_TOKEN_FILE)
-        if token_file.exists():
-            token_file.unlink()
-            logger.info("Download token invalidated after successful download")
+        invalidate_download_token()
+        logger.info("Download token invalidated after successful download")
         
         return response
     
@@ -125,21 +97,16 @@ def download_zip():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/health')
-def health():
-    try:
-        logger.debug("Health check accessed")
-        return jsonify({'status': 'healthy'}), 200
-    except Exception as e:
-        logger.error(f"Error in health route: {e}")
-        return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
+async def health():
+    logger.debug("Health check accessed")
+    return jsonify({'status': 'healthy'}), 200
 
 @app.route('/trigger-package', methods=['POST'])
-def trigger_package():
+async def trigger_package():
     try:
         logger.info("Trigger package route accessed")
         
-        expected_key = os.getenv('TRIGGER_API_KEY', '')
-        if not expected_key:
+        if not config.TRIGGER_API_KEY:
             logger.error("TRIGGER_API_KEY not configured in environment")
             return jsonify({'error': 'Server misconfigured. TRIGGER_API_KEY must be set in .env file.'}), 500
         
@@ -151,9 +118,9 @@ def trigger_package():
         monitor = get_credit_monitor()
         download_token = generate_download_token()
         
-        asyncio.run(monitor.handle_credit_limit_reached(download_token))
+        await monitor.handle_credit_limit_reached(download_token)
         
-        replit_domain = os.getenv('REPLIT_DOMAINS', 'your-repl.replit.dev').split(',')[0]
+        replit_domain = config.REPLIT_DOMAIN
         download_url = f"https://{replit_domain}/download-zip?token={download_token}"
         
         logger.info(f"Package created successfully, download URL: {download_url}")
@@ -169,12 +136,28 @@ def trigger_package():
         logger.error(f"Error triggering package: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/post-now', methods=['POST'])
+async def post_now():
+    logger.info("Post now route accessed")
+    
+    if not validate_trigger_key():
+        logger.warning(f"Unauthorized post-now attempt from {request.remote_addr}")
+        return jsonify({'error': 'Unauthorized. Provide valid X-Trigger-Key header.'}), 401
+    
+    if scheduler_instance is None:
+        return jsonify({'error': 'Scheduler is not running'}), 503
+    
+    scheduler_instance.post_now()
+    return jsonify({'success': True, 'message': 'Repost cycle triggered'}), 202
+
 if __name__ == '__main__':
+    # Only configure logging when run standalone; main.py sets its own format
+    logging.basicConfig(level=logging.INFO)
     try:
-        port = int(os.getenv('PORT', 5000))
-        logger.info(f"Starting Flask server on port {port}")
+        port = config.PORT
+        logger.info(f"Starting server on port {port}")
         logger.info("SECURITY: Ensure TRIGGER_API_KEY is set in .env file")
         app.run(host='0.0.0.0', port=port, debug=False)
     except Exception as e:
-        logger.error(f"Failed to start Flask server: {e}", exc_info=True)
+        logger.error(f"Failed to start server: {e}", exc_info=True)
         raise
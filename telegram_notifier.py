@@ -1,18 +1,62 @@
-import os
+import asyncio
 import logging
-from typing import Optional
+from types import MappingProxyType
+from typing import List, Optional, Tuple
 from telegram import Bot
-from dotenv import load_dotenv
-
-load_dotenv()
+import config
 
 logger = logging.getLogger(__name__)
 
+EMOJI_MAP = MappingProxyType({
+    'success': '✅',
+    'error': '❌',
+    'warning': '⚠️',
+    'info': 'ℹ️',
+    'posted': '📸',
+    'zip': '📦'
+})
+
+POST_SUCCESS_TEMPLATE = """
+📸 <b>Instagram Post Published!</b>
+
+🎬 <b>Video:</b> {video_title}
+👤 <b>Author:</b> {video_author}
+❤️ <b>Likes:</b> {likes:,} | 👁 <b>Views:</b> {views:,} {views_suffix}
+
+📝 <b>Caption Preview:</b>
+{caption_preview}...
+
+✅ <b>Status:</b> Posted Successfully
+🆔 <b>Media ID:</b> {media_id}
+⏰ <b>Posted At:</b> {time_str}
+⚡ <b>Duration:</b> {duration_str}
+"""
+
+POST_FAILURE_TEMPLATE = """
+❌ <b>Instagram Post Failed!</b>
+
+🎬 <b>Video:</b> {video_title}
+👤 <b>Author:</b> {video_author}
+❤️ <b>Likes:</b> {likes:,} | 👁 <b>Views:</b> {views:,} {views_suffix}
+
+📝 <b>Caption Preview:</b>
+{caption_preview}...
+
+❌ <b>Status:</b> Failed
+🔴 <b>Error:</b> {error}
+⏰ <b>Attempted At:</b> {time_str}
+"""
+
 class TelegramNotifier:
+    # Notifications queued within this window go out as a single Telegram message
+    COALESCE_WINDOW = 0.2
+    BATCH_SEPARATOR = "\n\n---\n\n"
+    MAX_MESSAGE_LENGTH = 4096
+    
     def __init__(self):
         logger.info("Initializing Telegram Notifier")
-        self.bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
-        self.chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
+        self.bot_token = config.TELEGRAM_BOT_TOKEN
+        self.chat_id = config.TELEGRAM_CHAT_ID
         
         if not self.bot_token or not self.chat_id:
             logger.error("TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID must be set in .env file")
@@ -24,32 +68,100 @@ class TelegramNotifier:
         except Exception as e:
             logger.error(f"Failed to initialize Telegram Bot: {e}")
             raise
+        
+        # Created on first use so the notifier can be constructed outside the event loop
+        self._queue: Optional[asyncio.Queue] = None
+        self._sender_task: Optional[asyncio.Task] = None
+    
+    def _ensure_sender(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._sender_task is None or self._sender_task.done():
+            self._sender_task = asyncio.create_task(self._run_sender())
+        return self._queue
+    
+    def _pack_batch(self, messages: List[str]) -> List[str]:
+        """Join queued messages into as few texts as fit Telegram's length limit"""
+        texts = []
+        current = messages[0]
+        for message in messages[1:]:
+            candidate = f"{current}{self.BATCH_SEPARATOR}{message}"
+            if len(candidate) > self.MAX_MESSAGE_LENGTH:
+                texts.append(current)
+                current = message
+            else:
+                current = candidate
+        texts.append(current)
+        return texts
+    
+    def _plan_sends(self, batch: List[Tuple[str, bool]]) -> List[str]:
+        """Coalesce runs of short notifications while keeping every message in queue order"""
+        texts = []
+        run = []
+        for text, coalesce in batch:
+            if coalesce:
+                run.append(text)
+                continue
+            if run:
+                texts.extend(self._pack_batch(run))
+                run = []
+            texts.append(text)
+        if run:
+            texts.extend(self._pack_batch(run))
+        return texts
+    
+    def _enqueue(self, text: str, coalesce: bool):
+        self._ensure_sender().put_nowait((text, coalesce))
+    
+    async def _run_sender(self):
+        """Drain the queue in order, coalescing bursts of notifications into one send_message call"""
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if batch[0][1]:
+                # Give a burst of notifications a moment to arrive so they go out together
+                await asyncio.sleep(self.COALESCE_WINDOW)
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            try:
+                for text in self._plan_sends(batch):
+                    try:
+                        await self.bot.send_message(
+                            chat_id=self.chat_id,
+                            text=text,
+                            parse_mode='HTML'
+                        )
+                    except Exception as e:
+                        logger.error(f"Error sending Telegram message: {e}", exc_info=True)
+                        logger.error(f"Failed message: {text[:100]}...")
+                logger.info(f"Telegram messages sent successfully ({len(batch)} queued)")
+            finally:
+                for _ in batch:
+                    queue.task_done()
+    
+    async def close(self):
+        """Flush queued notifications and stop the sender task"""
+        if self._queue is not None and self._sender_task is not None and not self._sender_task.done():
+            await self._queue.join()
+        if self._sender_task is not None:
+            self._sender_task.cancel()
+            try:
+                await self._sender_task
+            except asyncio.CancelledError:
+                pass
+            self._sender_task = None
     
     async def send_notification(self, message: str, notification_type: str = "info"):
         try:
-            emoji_map = {
-                'success': '✅',
-                'error': '❌',
-                'warning': '⚠️',
-                'info': 'ℹ️',
-                'posted': '📸',
-                'zip': '📦'
-            }
-            
-            emoji = emoji_map.get(notification_type, 'ℹ️')
+            emoji = EMOJI_MAP.get(notification_type, 'ℹ️')
             formatted_message = f"{emoji} {message}"
             
-            logger.info(f"Sending Telegram notification: {notification_type}")
-            
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=formatted_message,
-                parse_mode='HTML'
-            )
-            logger.info(f"Telegram notification sent successfully: {notification_type}")
+            logger.info(f"Queueing Telegram notification: {notification_type}")
+            self._enqueue(formatted_message, coalesce=True)
             
         except Exception as e:
-            logger.error(f"Error sending Telegram notification: {e}", exc_info=True)
+            logger.error(f"Error queueing Telegram notification: {e}", exc_info=True)
             logger.error(f"Failed message: {message[:100]}...")
     
     async def send_post_report(self, 
@@ -66,56 +178,35 @@ class TelegramNotifier:
         try:
             logger.info("Preparing enhanced post report for Telegram")
             
+            fields = {
+                'video_title': video_title if video_title else 'N/A',
+                'video_author': video_author if video_author else 'N/A',
+                'likes': likes,
+                'views': views,
+                'views_suffix': f'({views})' if views else '',
+                'caption_preview': caption[:150] if caption else 'N/A',
+                'time_str': timestamp.isoformat(sep=' ', timespec='seconds') if timestamp else 'N/A'
+            }
+            
             if media_id:
                 # Success message with full details
-                time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else 'N/A'
-                duration_str = f"{duration:.1f}s" if duration else 'N/A'
-                
-                message = f"""
-📸 <b>Instagram Post Published!</b>
-
-🎬 <b>Video:</b> {video_title if video_title else 'N/A'}
-👤 <b>Author:</b> {video_author if video_author else 'N/A'}
-❤️ <b>Likes:</b> {likes:,} | 👁 <b>Views:</b> {views:,} {f'({views})' if views else ''}
-
-📝 <b>Caption Preview:</b>
-{caption[:150] if caption else 'N/A'}...
-
-✅ <b>Status:</b> Posted Successfully
-🆔 <b>Media ID:</b> {media_id}
-⏰ <b>Posted At:</b> {time_str}
-⚡ <b>Duration:</b> {duration_str}
-"""
+                message = POST_SUCCESS_TEMPLATE.format(
+                    media_id=media_id,
+                    duration_str=f"{duration:.1f}s" if duration else 'N/A',
+                    **fields
+                )
                 logger.info(f"Post successful - Media ID: {media_id}")
             else:
                 # Error message
-                time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else 'N/A'
-                
-                message = f"""
-❌ <b>Instagram Post Failed!</b>
-
-🎬 <b>Video:</b> {video_title if video_title else 'N/A'}
-👤 <b>Author:</b> {video_author if video_author else 'N/A'}
-❤️ <b>Likes:</b> {likes:,} | 👁 <b>Views:</b> {views:,} {f'({views})' if views else ''}
-
-📝 <b>Caption Preview:</b>
-{caption[:150] if caption else 'N/A'}...
-
-❌ <b>Status:</b> Failed
-🔴 <b>Error:</b> {error}
-⏰ <b>Attempted At:</b> {time_str}
-"""
+                message = POST_FAILURE_TEMPLATE.format(error=error, **fields)
                 logger.error(f"Post failed - Error: {error}")
             
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=message,
-                parse_mode='HTML'
-            )
-            logger.info("Enhanced post report sent to Telegram successfully")
+            # Reports go through the notification queue, unbatched, so they keep their place in line
+            self._enqueue(message, coalesce=False)
+            logger.info("Enhanced post report queued for Telegram")
             
         except Exception as e:
-            logger.error(f"Error sending post report to Telegram: {e}", exc_info=True)
+            logger.error(f"Error queueing post report for Telegram: {e}", exc_info=True)
     
     async def send_zip_download_link(self, download_url: str):
         try:
@@ -130,12 +221,17 @@ Your Instagram bot has been packaged and is ready for download.
 The bot will continue running but you should download the package and deploy it to your own VPS to avoid additional charges.
 """
             
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=message,
-                parse_mode='HTML'
-            )
-            logger.info("ZIP download link sent to Telegram successfully")
+            self._enqueue(message, coalesce=False)
+            logger.info("ZIP download link queued for Telegram")
             
         except Exception as e:
-            logger.error(f"Error sending ZIP download link to Telegram: {e}", exc_info=True)
+            logger.error(f"Error queueing ZIP download link for Telegram: {e}", exc_info=True)
+
+_notifier_instance: Optional[TelegramNotifier] = None
+
+def get_notifier() -> TelegramNotifier:
+    """Return the process-wide notifier so every module shares one Bot and HTTP session"""
+    global _notifier_instance
+    if _notifier_instance is None:
+        _notifier_instance = TelegramNotifier()
+    return _notifier_instance
@@ -1,15 +1,42 @@
 import os
+import mmap
+import time
 import logging
-from typing import Optional, Dict
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import Optional, Dict, Iterable
 from pathlib import Path
+import httpx
 from instagrapi import Client
-from dotenv import load_dotenv
+import config
 
-load_dotenv()
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, which has no O_DIRECT either
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# Fallback filenames only need to be unique, not unpredictable
+_filename_counter = itertools.count()
+
 class VideoDownloader:
+    # Received chunks are coalesced so each write() syscall flushes this much data
+    WRITE_BUFFER_SIZE = 1024 * 1024
+    OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+    # Transfers at least this large bypass the page cache with O_DIRECT where supported
+    DIRECT_IO_THRESHOLD = 32 * 1024 * 1024
+    # Smaller files aren't worth splitting into parallel range requests
+    PARALLEL_DOWNLOAD_MIN_SIZE = 8 * 1024 * 1024
+    DOWNLOAD_TIMEOUT = 60.0
+    # Cleanup fans unlinks out to a thread pool once this many files are stale
+    PARALLEL_CLEANUP_MIN_FILES = 64
+    CLEANUP_WORKERS = 8
+    VIDEO_SUFFIXES = ('.mp4',)
+    
     def __init__(self, instagram_client: Optional[Client] = None):
         """
         Initialize video downloader
@@ -19,11 +46,44 @@ class VideoDownloader:
         """
         logger.info("Initializing Video Downloader")
         self.client = instagram_client
-        self.download_path = Path(os.getenv('VIDEO_DOWNLOAD_PATH', 'downloaded_videos'))
+        self.download_path = Path(config.VIDEO_DOWNLOAD_PATH)
+        self.connections = max(1, config.DOWNLOAD_CONNECTIONS)
+        self.fsync = config.DOWNLOAD_FSYNC
+        
+        # Persistent HTTP clients, created on the first direct-URL download so startup doesn't pay for them
+        self._http: Optional[httpx.Client] = None
+        self._range_http: Optional[httpx.Client] = None
+        self._http_lock = threading.Lock()
         
         # Create download directory if it doesn't exist
         self.download_path.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Download path: {self.download_path.absolute()}")
+        # Working directory captured once; get_video_info resolves relative paths against it without calling getcwd
+        self._cwd = os.getcwd()
+        logger.info("Download path: %s", os.path.join(self._cwd, self.download_path))
+    
+    def _get_http(self) -> httpx.Client:
+        """Client for single-stream downloads and HEAD probes, reused so TLS and keepalive carry over"""
+        with self._http_lock:
+            if self._http is None:
+                self._http = httpx.Client(
+                    http2=True,
+                    follow_redirects=True,
+                    timeout=self.DOWNLOAD_TIMEOUT,
+                    limits=httpx.Limits(max_connections=16, keepalive_expiry=30)
+                )
+            return self._http
+    
+    def _get_range_http(self) -> httpx.Client:
+        """Client for parallel range requests"""
+        with self._http_lock:
+            if self._range_http is None:
+                # Range requests stay on HTTP/1.1: over HTTP/2 they would all share one TCP connection
+                self._range_http = httpx.Client(
+                    follow_redirects=True,
+                    timeout=self.DOWNLOAD_TIMEOUT,
+                    limits=httpx.Limits(max_connections=self.connections, keepalive_expiry=30)
+                )
+            return self._range_http
     
     def download_video(self, media_id: str, video_code: str) -> Optional[str]:
         """
@@ -37,7 +97,7 @@ class VideoDownloader:
             Path to downloaded video file or None if failed
         """
         try:
-            logger.info(f"Downloading video: {video_code} (ID: {media_id})")
+            logger.info("Downloading video: %s (ID: %s)", video_code, media_id)
             
             if not self.client:
                 logger.error("Instagram client not provided")
@@ -46,15 +106,19 @@ class VideoDownloader:
             # Download video using instagrapi (downloads without watermark)
             video_path = self.client.video_download(media_id, folder=str(self.download_path))
             
-            if video_path and Path(video_path).exists():
-                logger.info(f"Video downloaded successfully: {video_path}")
-                return str(video_path)
-            else:
-                logger.error(f"Failed to download video: {video_code}")
-                return None
+            # One stat confirms the file exists and that it isn't empty
+            try:
+                if video_path and os.path.getsize(video_path):
+                    logger.info("Video downloaded successfully: %s", video_path)
+                    return str(video_path)
+            except FileNotFoundError:
+                pass
+            
+            logger.error("Failed to download video: %s", video_code)
+            return None
                 
         except Exception as e:
-            logger.error(f"Error downloading video {video_code}: {e}", exc_info=True)
+            logger.error("Error downloading video %s: %s", video_code, e, exc_info=logger.isEnabledFor(logging.DEBUG))
             return None
     
     def download_video_from_url(self, video_url: str, filename: Optional[str] = None) -> Optional[str]:
@@ -69,63 +133,250 @@ class VideoDownloader:
             Path to downloaded file or None
         """
         try:
-            import httpx
-            
-            logger.info(f"Downloading video from URL: {video_url[:50]}...")
+            logger.info("Downloading video from URL: %s...", video_url[:50])
             
-            if not filename:
-                filename = f"video_{os.urandom(8).hex()}.mp4"
+            output_path = self._output_path(filename)
             
-            output_path = self.download_path / filename
-            
-            # Download with httpx
-            with httpx.stream('GET', video_url, follow_redirects=True, timeout=60.0) as response:
-                response.raise_for_status()
-                
-                with open(output_path, 'wb') as f:
-                    for chunk in response.iter_bytes(chunk_size=8192):
-                        f.write(chunk)
+            total_size = self._parallel_download_size(self._get_http(), video_url)
+            if total_size:
+                try:
+                    self._download_ranges(self._get_range_http(), video_url, output_path, total_size)
+                except (httpx.HTTPError, OSError, ValueError) as e:
+                    logger.warning("Parallel download failed, retrying as a single stream: %s", e)
+                    total_size = 0
+            if not total_size:
+                self._download_stream(self._get_http(), video_url, output_path)
             
-            logger.info(f"Video downloaded from URL: {output_path}")
+            logger.info("Video downloaded from URL: %s", output_path)
             return str(output_path)
             
         except Exception as e:
-            logger.error(f"Error downloading from URL: {e}", exc_info=True)
+            logger.error("Error downloading from URL: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
             return None
     
-    def get_video_info(self, video_path: str) -> Dict:
+    def _output_path(self, filename: Optional[str]) -> Path:
+        if not filename:
+            filename = f"video_{os.getpid()}_{next(_filename_counter)}_{int(time.time())}.mp4"
+        return self.download_path / filename
+    
+    def _download_stream(self, client: httpx.Client, video_url: str, output_path: Path):
+        """Download the whole file over one connection"""
+        with client.stream('GET', video_url) as response:
+            response.raise_for_status()
+            
+            expected_size = int(response.headers.get('content-length') or 0)
+            unencoded = response.headers.get('content-encoding', 'identity') == 'identity'
+            fd, direct = self._open_output(output_path, direct=expected_size >= self.DIRECT_IO_THRESHOLD)
+            try:
+                # Content-Length only matches the bytes written when the body isn't encoded
+                preallocated = unencoded and self._preallocate(fd, expected_size)
+                # Chunks arrive sized by the transport; _write_chunks does the batching.
+                # An unencoded body is read raw, skipping httpx's decoder layer
+                chunks = response.iter_raw() if unencoded else response.iter_bytes()
+                written = self._write_chunks(fd, chunks, direct=direct)
+                if preallocated and written != expected_size:
+                    os.ftruncate(fd, written)
+                self._sync_output(fd)
+            finally:
+                os.close(fd)
+    
+    def _parallel_download_size(self, client: httpx.Client, video_url: str) -> int:
+        """
+        Check whether the server supports splitting this download into byte ranges
+        
+        Returns:
+            Size of the file to fetch in parallel, or 0 to use a single stream
+        """
+        if self.connections < 2 or not hasattr(os, 'pwrite'):
+            return 0
+        
+        try:
+            response = client.head(video_url)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.debug("HEAD request failed, using a single stream: %s", e)
+            return 0
+        
+        headers = response.headers
+        size = int(headers.get('content-length') or 0)
+        # Ranges of an encoded body wouldn't line up with the decoded bytes we write
+        if headers.get('accept-ranges', '').lower() != 'bytes' or headers.get('content-encoding', 'identity') != 'identity':
+            return 0
+        return size if size >= self.PARALLEL_DOWNLOAD_MIN_SIZE else 0
+    
+    def _download_ranges(self, client: httpx.Client, video_url: str, output_path: Path, total_size: int):
+        """Fetch the file as equal byte ranges over parallel connections, writing each at its offset"""
+        segment_size = -(-total_size // self.connections)
+        ranges = [(start, min(start + segment_size, total_size) - 1) for start in range(0, total_size, segment_size)]
+        logger.info("Downloading %.1f MB in %s parallel ranges", total_size / (1024 * 1024), len(ranges))
+        
+        fd = os.open(output_path, self.OPEN_FLAGS, 0o644)
+        try:
+            self._preallocate(fd, total_size)
+            with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix='download-range') as pool:
+                futures = [pool.submit(self._fetch_range, client, video_url, fd, start, end) for start, end in ranges]
+                for future in futures:
+                    future.result()
+            self._sync_output(fd)
+        finally:
+            os.close(fd)
+    
+    def _fetch_range(self, client: httpx.Client, video_url: str, fd: int, start: int, end: int):
+        with client.stream('GET', video_url, headers={'Range': f'bytes={start}-{end}'}) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise ValueError(f"Server ignored range request (status {response.status_code})")
+            
+            offset = start
+            # Range downloads are only used for unencoded bodies, so the raw stream is the file data
+            for chunk in response.iter_raw(chunk_size=self.WRITE_BUFFER_SIZE):
+                data = memoryview(chunk)
+                while data:
+                    written = os.pwrite(fd, data, offset)
+                    offset += written
+                    data = data[written:]
+        
+        if offset != end + 1:
+            raise ValueError(f"Range {start}-{end} ended after {offset - start} bytes")
+    
+    def _open_output(self, output_path: Path, direct: bool = False):
+        """
+        Open the download target, trying O_DIRECT for large transfers
+        
+        Returns:
+            Tuple of (file descriptor, whether O_DIRECT is in effect)
+        """
+        if direct and fcntl is not None and hasattr(os, 'O_DIRECT'):
+            try:
+                return os.open(output_path, self.OPEN_FLAGS | os.O_DIRECT, 0o644), True
+            except OSError as e:
+                # Filesystems such as tmpfs reject O_DIRECT with EINVAL
+                logger.debug("O_DIRECT unavailable for %s: %s", output_path, e)
+        return os.open(output_path, self.OPEN_FLAGS, 0o644), False
+    
+    @staticmethod
+    def _preallocate(fd: int, size: int) -> bool:
+        """
+        Reserve the file's full size up front so the filesystem can allocate contiguous extents
+        
+        Returns:
+            True if the space was reserved
+        """
+        if size <= 0 or not hasattr(os, 'posix_fallocate'):
+            return False
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return True
+        except OSError as e:
+            # Some filesystems don't support fallocate; writing without it is fine
+            logger.debug("posix_fallocate unavailable: %s", e)
+            return False
+    
+    def _sync_output(self, fd: int):
+        """Flush file data to disk before close when durable downloads are enabled"""
+        if self.fsync:
+            # fdatasync skips the metadata-only journal flush where the platform offers it
+            getattr(os, 'fdatasync', os.fsync)(fd)
+    
+    @staticmethod
+    def _write_all(fd: int, data: memoryview):
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+    
+    def _write_chunks(self, fd: int, chunks: Iterable[bytes], direct: bool = False) -> int:
+        """
+        Copy chunks into a page-aligned write buffer, flushing it to fd each time it fills
+        
+        Args:
+            fd: File descriptor opened for writing
+            chunks: Byte chunks in file order
+            direct: fd was opened with O_DIRECT; full-buffer flushes are page-aligned,
+                so only the unaligned tail needs O_DIRECT cleared first
+            
+        Returns:
+            Total number of bytes written
+        """
+        # One buffer per call so concurrent downloads never share staging memory
+        with mmap.mmap(-1, self.WRITE_BUFFER_SIZE) as write_buffer:
+            buffer = memoryview(write_buffer)
+            try:
+                capacity = len(buffer)
+                filled = 0
+                total = 0
+                
+                for chunk in chunks:
+                    chunk = memoryview(chunk)
+                    while chunk:
+                        take = min(capacity - filled, len(chunk))
+                        buffer[filled:filled + take] = chunk[:take]
+                        filled += take
+                        chunk = chunk[take:]
+                        if filled == capacity:
+                            self._write_all(fd, buffer)
+                            total += filled
+                            filled = 0
+                
+                if filled:
+                    if direct:
+                        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_DIRECT)
+                    self._write_all(fd, buffer[:filled])
+                    total += filled
+                return total
+            finally:
+                # The mmap can't close while a memoryview still exports it
+                buffer.release()
+    
+    def get_video_info(self, video_path: str, st: Optional[os.stat_result] = None) -> Dict:
         """
         Get video file information
         
         Args:
             video_path: Path to video file
+            st: Stat result the caller already has, to skip another stat call
             
         Returns:
             Dictionary with video metadata
         """
         try:
-            path = Path(video_path)
-            if not path.exists():
-                return {}
+            if st is None:
+                try:
+                    st = os.stat(video_path)
+                except FileNotFoundError:
+                    return {}
             
-            file_size = path.stat().st_size
-            file_size_mb = file_size / (1024 * 1024)
+            file_size = st.st_size
+            filename = os.path.basename(video_path)
             
             info = {
-                'path': str(path.absolute()),
-                'filename': path.name,
+                'path': str(video_path) if os.path.isabs(video_path) else os.path.join(self._cwd, video_path),
+                'filename': filename,
                 'size_bytes': file_size,
-                'size_mb': round(file_size_mb, 2),
+                'size_mb': round(file_size / (1024 * 1024), 2),
                 'exists': True
             }
             
-            logger.debug(f"Video info: {info}")
+            logger.debug("Video info: %s", info)
             return info
             
         except Exception as e:
-            logger.error(f"Error getting video info: {e}")
+            logger.error("Error getting video info: %s", e)
             return {}
     
+    @staticmethod
+    def _unlink_video(video_file: os.DirEntry, dir_fd: Optional[int]) -> bool:
+        """Delete one video, logging instead of raising on failure"""
+        try:
+            if dir_fd is not None:
+                os.unlink(video_file.name, dir_fd=dir_fd)
+            else:
+                os.unlink(video_file.path)
+            logger.debug("Deleted old video: %s", video_file.name)
+            return True
+        except Exception as e:
+            logger.error("Failed to delete %s: %s", video_file.name, e)
+            return False
+    
     def cleanup_old_videos(self, keep_latest: int = 5):
         """
         Clean up old downloaded videos, keeping only the latest N files
@@ -134,29 +385,47 @@ class VideoDownloader:
             keep_latest: Number of latest videos to keep
         """
         try:
-            logger.info(f"Cleaning up old videos, keeping latest {keep_latest}")
-            
-            # Get all video files sorted by modification time
-            video_files = sorted(
-                self.download_path.glob('*.mp4'),
-                key=lambda x: x.stat().st_mtime,
-                reverse=True
-            )
-            
-            # Delete old files
-            deleted_count = 0
-            for video_file in video_files[keep_latest:]:
-                try:
-                    video_file.unlink()
-                    logger.debug(f"Deleted old video: {video_file.name}")
-                    deleted_count += 1
-                except Exception as e:
-                    logger.error(f"Failed to delete {video_file.name}: {e}")
+            logger.info("Cleaning up old videos, keeping latest %s", keep_latest)
+            
+            # One scandir pass instead of glob; the file-type check uses the dirent type, leaving one stat per file for the mtime
+            with os.scandir(self.download_path) as entries:
+                video_files = [
+                    (entry.stat().st_mtime, entry) for entry in entries
+                    if entry.name.endswith(self.VIDEO_SUFFIXES) and entry.is_file(follow_symlinks=False)
+                ]
+            video_files.sort(key=itemgetter(0), reverse=True)
+            
+            # Delete old files relative to one directory fd so the path isn't re-resolved per file
+            stale_files = video_files[keep_latest:]
+            dir_fd = None
+            if stale_files and os.unlink in os.supports_dir_fd:
+                dir_fd = os.open(self.download_path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+            
+            try:
+                stale_entries = [entry for _, entry in stale_files]
+                if len(stale_entries) >= self.PARALLEL_CLEANUP_MIN_FILES:
+                    # Metadata-bound unlinks overlap well across threads on large backlogs
+                    with ThreadPoolExecutor(max_workers=self.CLEANUP_WORKERS, thread_name_prefix='cleanup') as pool:
+                        deleted_count = sum(pool.map(lambda entry: self._unlink_video(entry, dir_fd), stale_entries))
+                else:
+                    deleted_count = sum(self._unlink_video(entry, dir_fd) for entry in stale_entries)
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
             
             if deleted_count > 0:
-                logger.info(f"Cleaned up {deleted_count} old videos")
+                logger.info("Cleaned up %s old videos", deleted_count)
             else:
                 logger.info("No old videos to clean up")
                 
         except Exception as e:
-            logger.error(f"Error cleaning up videos: {e}", exc_info=True)
+            logger.error("Error cleaning up videos: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+    
+    def close(self):
+        """Close the HTTP connection pools"""
+        with self._http_lock:
+            for client in (self._http, self._range_http):
+                if client is not None:
+                    client.close()
+            self._http = self._range_http = None
+        logger.info("Video Downloader HTTP clients closed")